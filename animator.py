@@ -0,0 +1,98 @@
+import time
+from profiler import metrics
+
+
+class Animator:
+    """
+    Timer-driven animation of a Plot.
+
+    Every tick takes the next frame from frame_seq and passes it to Plot.animate.
+    With blit enabled only the returned artists are redrawn over the cached
+    background, otherwise the whole figure is redrawn.
+    Frame and drawing times are recorded in profiler.metrics when enabled.
+
+    More plots of the same figure may be added as panels with their own
+    frame sequences; a tick redraws only the panels which got a new frame.
+
+    panels - list of (plot, frame_seq) pairs, the first one is (plot, frame_seq);
+    """
+    def __init__(self, plot, frame_seq, interval=20, blit=True):
+        self.plot = plot
+        self.frame_seq = frame_seq
+        self.panels = []
+        self.connections = []
+        self.blit = blit
+        self.running = False
+        self.frames = 0
+        self.last_step = None
+        self.timer = plot.fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.step)
+        self.add(plot, frame_seq)
+        self.resume()
+
+    def add(self, plot, frame_seq):
+        self.connections.append(plot.fig.canvas.mpl_connect('draw_event', plot.on_draw))
+        plot.set_animated(self.blit and self.running)
+        self.panels.append((plot, frame_seq))
+
+    def replace(self, frame_seq, panel=0):
+        """
+        Animates the panel from another frame sequence, e.g. a recording instead of the worker.
+        """
+        plot, _ = self.panels[panel]
+        self.panels[panel] = (plot, frame_seq)
+        if panel == 0:
+            self.frame_seq = frame_seq
+
+    def swap(self, plot, panel=0):
+        """
+        Animates another plot in place of the panel, e.g. a 3-D view of the same equation.
+        """
+        old, frame_seq = self.panels[panel]
+        old.fig.canvas.mpl_disconnect(self.connections[panel])
+        self.connections[panel] = plot.fig.canvas.mpl_connect('draw_event', plot.on_draw)
+        plot.set_animated(self.blit and self.running)
+        self.panels[panel] = (plot, frame_seq)
+        if panel == 0:
+            self.plot = plot
+
+    def step(self):
+        updated = []
+        for plot, frame_seq in self.panels:
+            try:
+                updated.append((plot, next(frame_seq)))
+            except StopIteration:
+                continue
+        if not updated:
+            return
+        now = time.perf_counter()
+        if self.last_step is not None:
+            metrics.add("frame", (now - self.last_step) * 1e3)
+        self.last_step = now
+        self.frames += 1
+        if self.plot.hud is not None and self.frames % 10 == 0:
+            self.plot.hud.set_text(metrics.report())
+
+        for plot, data in updated:
+            artists = plot.animate(data)
+            with metrics.timer("draw"):
+                if self.blit:
+                    plot.blit(artists)
+        if not self.blit:
+            self.plot.fig.canvas.draw_idle()
+
+    def pause(self):
+        self.timer.stop()
+        self.running = False
+        self.last_step = None
+        if self.blit:
+            for plot, _ in self.panels:
+                plot.set_animated(False)
+            self.plot.fig.canvas.draw_idle()
+
+    def resume(self):
+        if self.blit:
+            for plot, _ in self.panels:
+                plot.set_animated(True)
+        self.timer.start()
+        self.running = True
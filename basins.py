@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import equation
+from batch import parse_params
+from history import COORDINATES
+from kernels import set_threads
+
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deterministic-chaos", "basins")
+# Layers of an explored tile.
+MODES = ("basin", "escape", "separation")
+
+
+def explore_tile(system, params, plane, fixed, xs, ys, duration, step, radius, threshold,
+                 reference, attractors):
+    """
+    Integrates initial conditions of a grid over the plane at once, together with
+    the reference trajectory, and returns (3, len(ys), len(xs)) float32 layers:
+
+    basin - index of the nearest attractor point at the end, -1 for diverged points;
+    escape - time at which the point left the sphere of given radius, inf if it did not;
+    separation - time at which the point got farther than threshold from
+                 the reference trajectory, inf if it did not;
+
+    Runs in a worker process.
+    """
+    # The pool already runs a process on every core.
+    set_threads(1)
+    eq = equation.by_name(system)
+    eq.params.update(params)
+    eq.time_scale = 1 / step
+    eq.rk_step = step
+    first, second = COORDINATES[plane[0]], COORDINATES[plane[1]]
+    gx, gy = np.meshgrid(xs, ys)
+    n = gx.size
+    initial = np.empty((n + 1, 3))
+    initial[:n] = fixed
+    initial[:n, first] = gx.ravel()
+    initial[:n, second] = gy.ravel()
+    initial[n] = reference
+
+    frames = eq.ensemble_gen(initial)
+    escape = np.full(n, np.inf)
+    separation = np.full(n, np.inf)
+    points = initial
+    with np.errstate(all='ignore'):
+        for i in range(1, int(round(duration / step)) + 1):
+            points = next(frames)
+            # NaN compares false, so overflowed points count as escaped.
+            escaped = ~(np.abs(points[:n]).max(axis=1) <= radius) & np.isinf(escape)
+            escape[escaped] = i * step
+            apart = (np.linalg.norm(points[:n] - points[n], axis=1) > threshold) & np.isinf(separation)
+            separation[apart] = i * step
+        if attractors:
+            distances = np.linalg.norm(points[:n, np.newaxis] - np.asarray(attractors, dtype=float), axis=2)
+            basin = np.argmin(distances, axis=1).astype(float)
+        else:
+            basin = np.zeros(n)
+    basin[np.isfinite(escape)] = -1
+    return np.stack((basin, escape, separation)).reshape(3, len(ys), len(xs)).astype(np.float32)
+
+
+class BasinExplorer:
+    """
+    Maps outcomes of initial conditions over a 2-D slice of the phase space,
+    see explore_tile.
+
+    The plane is split into tiles of tile x tile points. At level k a tile
+    covers 1 / 2**k of the span of base along both axes, so zooming in uses
+    higher levels. Tiles are calculated in parallel in a process pool, each one
+    vectorized, and cached on disk, keyed by all settings of the integration,
+    so zooming or panning only calculates the tiles not seen before.
+
+    plane - two varied coordinates, e.g. "xy";
+    fixed - value of the third coordinate;
+    base - (xlim, ylim) covered by a single tile at level 0, the range of the window's sliders by default;
+    reference - initial conditions of the reference trajectory, by default the system's
+                defaults with the fixed coordinate set to fixed;
+    attractors - points classifying bounded trajectories by the nearest one, all in one class if empty;
+    """
+    def __init__(self, system, params=None, plane="xy", fixed=0., duration=20., step=0.01,
+                 radius=1e3, threshold=1., reference=None, attractors=(),
+                 base=((-2., 2.), (-2., 2.)), tile=128, cache_dir=CACHE_DIR):
+        eq = equation.by_name(system)
+        eq.params.update(params or {})
+        self.system = system
+        self.params = {name: float(value) for name, value in eq.params.items()}
+        self.plane = plane
+        self.fixed = float(fixed)
+        self.duration = duration
+        self.step = step
+        self.radius = radius
+        self.threshold = threshold
+        if reference is None:
+            # The system's default initial conditions, moved onto the plane.
+            reference = np.array(eq.default_state, dtype=float)
+            reference[3 - COORDINATES[plane[0]] - COORDINATES[plane[1]]] = fixed
+        self.reference = tuple(float(value) for value in reference)
+        self.attractors = tuple(tuple(float(value) for value in point) for point in attractors)
+        self.base = np.asarray(base, dtype=float)
+        self.tile = tile
+        self.cache_dir = cache_dir
+
+    def settings(self):
+        return (self.system, tuple(sorted(self.params.items())), self.plane, self.fixed, self.duration,
+                self.step, self.radius, self.threshold, self.reference, self.attractors,
+                tuple(map(tuple, self.base.tolist())), self.tile)
+
+    def tile_path(self, level, tx, ty):
+        if self.cache_dir is None:
+            return None
+        key = hashlib.sha1(repr(self.settings()).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key, "%d_%d_%d.npy" % (level, tx, ty))
+
+    def pixel(self, level):
+        """
+        Returns (dx, dy) spacing of grid points at given level.
+        """
+        return (self.base[:, 1] - self.base[:, 0]) / (self.tile << level)
+
+    def level(self, xlim, ylim, resolution):
+        """
+        Returns the lowest level with at least resolution points along both axes of the region.
+        """
+        spans = np.abs(np.array((xlim[1] - xlim[0], ylim[1] - ylim[0]), dtype=float))
+        needed = np.max((self.base[:, 1] - self.base[:, 0]) * resolution / (self.tile * spans))
+        return max(0, math.ceil(math.log2(needed)))
+
+    def tile_args(self, level, tx, ty):
+        dx, dy = self.pixel(level)
+        xs = self.base[0, 0] + (tx * self.tile + np.arange(self.tile) + 0.5) * dx
+        ys = self.base[1, 0] + (ty * self.tile + np.arange(self.tile) + 0.5) * dy
+        return (self.system, self.params, self.plane, self.fixed, xs, ys, self.duration, self.step,
+                self.radius, self.threshold, self.reference, self.attractors)
+
+    def run(self, xlim=None, ylim=None, resolution=1000, workers=None, context=None):
+        """
+        Returns (3, H, W) layers of the region (see explore_tile) with rows along y,
+        and its (left, right, bottom, top) extent, snapped to the grid points.
+        context - multiprocessing context of the worker processes, the default one if None;
+        """
+        xlim = self.base[0] if xlim is None else xlim
+        ylim = self.base[1] if ylim is None else ylim
+        if xlim[0] == xlim[1] or ylim[0] == ylim[1] or resolution < 1:
+            raise ValueError("the region has to have a nonzero width and height and resolution at least 1")
+        level = self.level(xlim, ylim, resolution)
+        pixel = self.pixel(level)
+        low = np.floor((np.array((min(xlim), min(ylim))) - self.base[:, 0]) / pixel).astype(int)
+        high = np.ceil((np.array((max(xlim), max(ylim))) - self.base[:, 0]) / pixel).astype(int)
+        tiles = [(tx, ty) for ty in range(low[1] // self.tile, -(-high[1] // self.tile))
+                 for tx in range(low[0] // self.tile, -(-high[0] // self.tile))]
+
+        results = dict()
+        missing = []
+        for tx, ty in tiles:
+            path = self.tile_path(level, tx, ty)
+            if path is not None and os.path.exists(path):
+                results[tx, ty] = np.load(path)
+            else:
+                missing.append((tx, ty))
+        if missing:
+            if self.cache_dir is not None:
+                os.makedirs(os.path.dirname(self.tile_path(level, 0, 0)), exist_ok=True)
+            args = zip(*(self.tile_args(level, tx, ty) for tx, ty in missing))
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                for (tx, ty), layers in zip(missing, pool.map(explore_tile, *args)):
+                    results[tx, ty] = layers
+                    if self.cache_dir is not None:
+                        np.save(self.tile_path(level, tx, ty), layers)
+
+        first_x, first_y = tiles[0]
+        columns = -(-high[0] // self.tile) - first_x
+        rows = -(-high[1] // self.tile) - first_y
+        mosaic = np.empty((3, rows * self.tile, columns * self.tile), dtype=np.float32)
+        for (tx, ty), layers in results.items():
+            i, j = (ty - first_y) * self.tile, (tx - first_x) * self.tile
+            mosaic[:, i:i + self.tile, j:j + self.tile] = layers
+        offset = low - np.array((first_x, first_y)) * self.tile
+        size = high - low
+        region = mosaic[:, offset[1]:offset[1] + size[1], offset[0]:offset[0] + size[0]]
+        left, bottom = self.base[:, 0] + low * pixel
+        right, top = self.base[:, 0] + high * pixel
+        return region, (left, right, bottom, top)
+
+
+def map_plot(layers, extent, mode, system, plane, fixed):
+    """
+    Returns plot.MapPlot of one layer of run's result, blank where nothing escaped or separated.
+    """
+    from plot import MapPlot
+    image = layers[MODES.index(mode)]
+    image = np.where(np.isinf(image), np.nan, image)
+    label = {"basin": "attractor (-1 diverged)", "escape": "escape time",
+             "separation": "separation time"}[mode]
+    title = "%s - %s (%s = %g)" % (equation.by_name(system), mode,
+                                    "xyz"[3 - COORDINATES[plane[0]] - COORDINATES[plane[1]]], fixed)
+    return MapPlot(image, extent, title, plane[0], plane[1], label)
+
+
+def parse_point(text):
+    return tuple(float(value) for value in text.split(","))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Map basins of attraction and sensitivity "
+                                                 "over a plane of initial conditions.")
+    parser.add_argument("system", help="system name, e.g. lorenz")
+    parser.add_argument("--plane", default="xy", choices=("xy", "yz", "xz"), help="varied coordinates")
+    parser.add_argument("--fixed", type=float, default=0., help="value of the remaining coordinate")
+    parser.add_argument("--region", type=float, nargs=4, metavar=("X0", "X1", "Y0", "Y1"),
+                        help="explored region, the range of the sliders (-2..2) by default")
+    parser.add_argument("--resolution", type=int, default=1000, help="points along each axis of the region")
+    parser.add_argument("--mode", choices=MODES,
+                        help="drawn layer, basin if any --attractor is given, separation otherwise")
+    parser.add_argument("--duration", type=float, default=20.)
+    parser.add_argument("--step", type=float, default=0.01)
+    parser.add_argument("--radius", type=float, default=1e3, help="points farther from the origin diverged")
+    parser.add_argument("--threshold", type=float, default=1., help="separation from the reference trajectory")
+    parser.add_argument("--reference", type=parse_point, metavar="X,Y,Z",
+                        help="initial conditions of the reference trajectory, system defaults on the plane if not given")
+    parser.add_argument("--attractor", type=parse_point, action="append", default=[], metavar="X,Y,Z",
+                        help="point of an attractor, bounded trajectories are classified by the nearest one; "
+                             "without any the basin layer only tells bounded (0) and diverged (-1) points apart")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE")
+    parser.add_argument("--workers", type=int, default=None, help="processes, all cores by default")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default="basins.png", help=".png/.pdf image or .npy array of all layers")
+    args = parser.parse_args(argv)
+
+    try:
+        params = parse_params(parser, args.param, equation.by_name(args.system))
+    except KeyError:
+        parser.error("unknown system %r" % args.system)
+    explorer = BasinExplorer(args.system, params, args.plane, args.fixed, args.duration, args.step,
+                             args.radius, args.threshold, args.reference, args.attractor,
+                             cache_dir=None if args.no_cache else CACHE_DIR)
+    xlim, ylim = (None, None) if args.region is None else (args.region[:2], args.region[2:])
+    if args.region is not None and (xlim[0] == xlim[1] or ylim[0] == ylim[1]):
+        parser.error("--region has to have a nonzero width and height")
+    if args.resolution < 1:
+        parser.error("--resolution has to be at least 1")
+    mode = args.mode or ("basin" if args.attractor else "separation")
+    start = time.perf_counter()
+    layers, extent = explorer.run(xlim, ylim, args.resolution, args.workers)
+    print("%dx%d points in %.2f s" % (layers.shape[2], layers.shape[1], time.perf_counter() - start))
+
+    if args.output.endswith(".npy"):
+        np.save(args.output, layers)
+    else:
+        map_plot(layers, extent, mode, args.system, args.plane, args.fixed).fig.savefig(args.output, dpi=150)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import sys
+import time
+import numpy as np
+import equation
+
+
+# The native fixed-step integrator and the methods of solve_ivp.
+METHODS = ("RK4", "RK45", "RK23", "DOP853", "Radau", "BDF", "LSODA")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Integrate a system of equations without GUI and save the trajectory to a .npy file.")
+    parser.add_argument("system", help="system name, e.g. lorenz, rossler, chua, chen, thomas, aizawa")
+    parser.add_argument("output", help="output .npy file, (steps + 1, 3) float64 array")
+    parser.add_argument("--duration", type=float, default=100., help="integrated time span")
+    parser.add_argument("--step", type=float, default=0.01, help="time between saved points")
+    parser.add_argument("--method", choices=METHODS, default="RK4",
+                        help="RK4 (native fixed-step) or a solve_ivp method")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="change a parameter of the system, may be repeated")
+    parser.add_argument("--initial", type=float, nargs=3, metavar=("X", "Y", "Z"),
+                        help="initial conditions, system defaults if not given")
+    parser.add_argument("--chunk", type=int, default=100000, help="number of points calculated at once")
+    args = parser.parse_args(argv)
+    if args.step <= 0:
+        parser.error("--step must be positive")
+
+    set_equation(parser, args)
+    return args
+
+
+def set_equation(parser, args):
+    """
+    Sets args.equation to the system chosen by args.system, args.param and args.initial.
+    """
+    args.equation = system_by_name(parser, args.system)
+    args.equation.params.update(parse_params(parser, args.param, args.equation))
+    if args.initial is not None:
+        args.equation.set_initial_conditions(*args.initial)
+
+
+def parse_params(parser, params, eq):
+    """
+    Returns dictionary of parameters of eq given as NAME=VALUE texts of --param options,
+    exits with a usage error on malformed ones.
+    """
+    values = dict()
+    for param in params:
+        name, equals, value = param.partition("=")
+        if not equals:
+            parser.error("--param expects NAME=VALUE, got %r" % param)
+        check_param(parser, eq, name)
+        try:
+            values[name] = float(value)
+        except ValueError:
+            parser.error("--param %s expects a number, got %r" % (name, value))
+    return values
+
+
+def system_by_name(parser, name):
+    """
+    Returns a new equation of the named system, see equation.by_name,
+    exits with a usage error if there is none.
+    """
+    try:
+        return equation.by_name(name)
+    except KeyError:
+        parser.error("unknown system %r" % name)
+
+
+def check_param(parser, eq, name):
+    """
+    Exits with a usage error if eq has no parameter of given name.
+    """
+    if name not in eq.params:
+        parser.error("%s has no parameter %r, choose from: %s" % (eq, name, ", ".join(eq.params)))
+
+
+def integrate_to_file(eq, output, duration, step, method="RK4", chunk=100000, report=None):
+    """
+    Integrates eq for given duration and streams points spaced by step into
+    a memory-mapped .npy file, so the trajectory is never held in memory.
+    Returns number of calculated steps, lower than requested if the solver failed.
+    """
+    steps = int(round(duration / step))
+    eq.time_scale = 1 / step
+    eq.method = method
+    eq.rk_step = step
+    out = np.lib.format.open_memmap(output, mode="w+", dtype=np.float64, shape=(steps + 1, 3))
+    out[0] = eq.history.last
+    frames = eq.data_gen()
+    done = 0
+    while done < steps:
+        frames.chunk_size = min(chunk, steps - done)
+        try:
+            points = frames.next_chunk()
+        except StopIteration:
+            break
+        out[done + 1:done + 1 + len(points)] = points
+        done += len(points)
+        out.flush()
+        if report is not None:
+            report(done, steps)
+    del out
+    return done
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    eq = args.equation
+
+    def report(done, steps):
+        print("\r%s: %d / %d steps" % (eq, done, steps), end="", file=sys.stderr)
+
+    start = time.perf_counter()
+    steps = integrate_to_file(eq, args.output, args.duration, args.step, args.method, args.chunk,
+                              report)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print("%d steps in %.2f s, %.0f steps/s" % (steps, elapsed, steps / elapsed))
+
+
+if __name__ == "__main__":
+    main()
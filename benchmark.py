@@ -0,0 +1,287 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import equation
+import kernels
+from plot import Plot, Plot3D
+
+
+METHODS = ("RK45", "DOP853", "LSODA", "RK4")
+# Longest allowed import time of a module in seconds, and packages it must not import.
+STARTUP_TARGETS = {"equation": 0.3, "batch": 0.3, "window": 0.6, "poincare": 0.3, "sweep": 0.3,
+                   "basins": 0.3, "lyapunov": 0.3, "export": 0.3, "recording": 0.3}
+DEFERRED = ("scipy", "matplotlib", "numba", "sympy")
+
+
+def timed(func, repeat):
+    """
+    Returns average time of a single func() call in seconds.
+    """
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def frames_per_second(eq, frames=1000, repeat=3):
+    """
+    Best of repeat measurements of frames per second produced by data_gen,
+    including the refills of the buffer. The first frame of a separate
+    generator is taken first to compile the kernels.
+    """
+    next(eq.data_gen())
+    best = 0.
+    for _ in range(repeat):
+        gen = eq.data_gen()
+        start = time.perf_counter()
+        for _ in itertools.islice(gen, frames):
+            pass
+        best = max(best, frames / (time.perf_counter() - start))
+    return best
+
+
+def bench_kernels(cls, calls=20000, frames=1000):
+    """
+    Compares the Python derivatives of a system with its native kernel.
+    """
+    eq = cls()
+    state = np.array(eq.history.last)
+    rhs = eq.rhs()
+    python_call = timed(lambda: eq.derivatives(0, state), calls)
+    kernel_call = timed(lambda: rhs(0, state), calls)
+
+    kernel = eq.kernel
+    eq.kernel = None
+    python_fps = frames_per_second(eq, frames)
+    eq.kernel = kernel
+    kernel_fps = frames_per_second(eq, frames)
+    eq.method = 'RK4'
+    rk4_fps = frames_per_second(eq, frames * 10)
+    return {"system": str(eq),
+            "python_call_us": python_call * 1e6,
+            "kernel_call_us": kernel_call * 1e6,
+            "python_fps": python_fps,
+            "kernel_fps": kernel_fps,
+            "rk4_fps": rk4_fps}
+
+
+def print_kernels():
+    print("numba:", kernels.NUMBA)
+    print("%-16s %12s %12s %8s %12s %12s %8s %12s" % (
+        "system", "python [us]", "kernel [us]", "speedup",
+        "python fps", "kernel fps", "speedup", "RK4 fps"))
+    for cls in equation.SYSTEMS:
+        r = bench_kernels(cls)
+        print("%-16s %12.2f %12.2f %7.1fx %12.0f %12.0f %7.1fx %12.0f" % (
+            r["system"], r["python_call_us"], r["kernel_call_us"],
+            r["python_call_us"] / r["kernel_call_us"],
+            r["python_fps"], r["kernel_fps"], r["kernel_fps"] / r["python_fps"], r["rk4_fps"]))
+
+
+def animate_ms(cls, frames=100, history=2000, view=Plot):
+    """
+    Average time of Plot.animate plus blitting of one frame on the Agg canvas,
+    measured with history frames already in the trace.
+    """
+    eq = cls()
+    eq.method = 'RK4'
+    points = eq.data_gen()
+    points.chunk_size = history
+    eq.history.extend(points.next_chunk())
+    points.chunk_size = 250
+    plot = view(eq)
+    FigureCanvasAgg(plot.fig)
+    plot.fig.canvas.mpl_connect('draw_event', plot.on_draw)
+    plot.blit(plot.animate(next(points)))
+    start = time.perf_counter()
+    for point in itertools.islice(points, frames):
+        plot.blit(plot.animate(point))
+    return (time.perf_counter() - start) / frames * 1e3
+
+
+def print_render(lengths=(2000, 20000, 49000)):
+    """
+    Prints animate_ms of every system for growing histories, which should stay about the same.
+    """
+    print("%-16s %4s " % ("system", "view") + " ".join("%10s" % ("%d pts" % n) for n in lengths))
+    for cls in equation.SYSTEMS:
+        for view in (Plot, Plot3D):
+            print("%-16s %4s " % (cls.title, "3-D" if view is Plot3D else "2-D") +
+                  " ".join("%7.1f ms" % animate_ms(cls, 50, n, view) for n in lengths))
+
+
+def history_bytes(cls, frames=100000):
+    """
+    Memory allocated by the history of an equation while it receives frames.
+    """
+    eq = cls()
+    eq.method = 'RK4'
+    gen = eq.data_gen()
+    gen.chunk_size = frames
+    points = gen.next_chunk()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    eq.set_initial_conditions()
+    for point in points:
+        eq.update(point)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+def run_suite(frames=1000, log=None):
+    """
+    Measures every built-in system, returns JSON-serializable dictionary.
+    """
+    results = dict()
+    for cls in equation.SYSTEMS:
+        name = str(cls())
+        metrics = dict()
+        for method in METHODS:
+            eq = cls()
+            eq.method = method
+            metrics["fps_" + method] = frames_per_second(eq, frames * 10 if method == "RK4" else frames)
+        metrics["animate_ms"] = animate_ms(cls)
+        # Close to the default trace_length, should cost about as much as the short one.
+        metrics["animate_long_ms"] = animate_ms(cls, history=45000)
+        metrics["history_bytes"] = history_bytes(cls)
+        results[name] = metrics
+        if log is not None:
+            log(name, metrics)
+    return {"python": platform.python_version(),
+            "numpy": np.__version__,
+            "matplotlib": matplotlib.__version__,
+            "numba": kernels.NUMBA,
+            "results": results}
+
+
+def lower_is_better(metric):
+    return not metric.startswith("fps_")
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Returns list of (system, metric, baseline, current) worse than the baseline
+    by more than the tolerance (relative).
+    """
+    regressions = []
+    for system, metrics in baseline["results"].items():
+        for metric, old in metrics.items():
+            new = current["results"].get(system, {}).get(metric)
+            if new is None or old == 0:
+                continue
+            change = (new - old) / abs(old)
+            if lower_is_better(metric):
+                worse = change > tolerance
+            else:
+                worse = change < -tolerance
+            if worse:
+                regressions.append((system, metric, old, new))
+    return regressions
+
+
+def import_profile(module, repeat=3):
+    """
+    Runs python -X importtime in a fresh interpreter and returns the best
+    of repeat cumulative import times of module in seconds, together with
+    the set of imported top-level packages. Returns (None, error) if the import fails.
+    """
+    best, packages = float("inf"), set()
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            name = name.strip()
+            packages.add(name.split(".")[0])
+            if name == module:
+                best = min(best, int(cumulative) / 1e6)
+    return best, packages
+
+
+def check_startup(targets=None, log=print):
+    """
+    Returns list of failures of the startup targets: modules importing slower
+    than their target, importing any DEFERRED package, or failing to import.
+    """
+    failures = []
+    for module, target in (targets or STARTUP_TARGETS).items():
+        seconds, packages = import_profile(module)
+        if seconds is None:
+            failures.append("%s: import failed: %s" % (module, packages))
+            continue
+        deferred = sorted(packages.intersection(DEFERRED))
+        log("%-10s %.3f s (target %.3f s)%s" % (module, seconds, target,
+                                                "  imports " + ", ".join(deferred) if deferred else ""))
+        if seconds > target:
+            failures.append("%s: %.3f s > %.3f s" % (module, seconds, target))
+        if deferred:
+            failures.append("%s: imports %s" % (module, ", ".join(deferred)))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark integration, rendering and memory use.")
+    parser.add_argument("--output", help="save results to a JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare with, exit code 1 on regressions "
+                                           "or failed startup targets")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative slowdown")
+    parser.add_argument("--frames", type=int, default=1000, help="frames per solve_ivp measurement")
+    parser.add_argument("--kernels", action="store_true", help="compare Python and native right-hand sides")
+    parser.add_argument("--render", action="store_true",
+                        help="print frame times of the 2-D and 3-D plots for growing histories")
+    parser.add_argument("--startup", action="store_true",
+                        help="check import times against STARTUP_TARGETS, exit code 1 on failures")
+    args = parser.parse_args(argv)
+
+    if args.kernels:
+        print_kernels()
+        return 0
+    if args.render:
+        print_render()
+        return 0
+    if args.startup:
+        failures = check_startup()
+        for failure in failures:
+            print("FAILED " + failure)
+        return 1 if failures else 0
+
+    def log(name, metrics):
+        print("%-16s " % name + "  ".join("%s=%.4g" % item for item in metrics.items()))
+
+    current = run_suite(args.frames, log)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(current, json.load(file), args.tolerance)
+        for system, metric, old, new in regressions:
+            print("REGRESSION %s %s: %.4g -> %.4g" % (system, metric, old, new))
+        # Import times are checked against their fixed targets rather than the baseline.
+        failures = check_startup()
+        for failure in failures:
+            print("FAILED " + failure)
+        if regressions or failures:
+            return 1
+        print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
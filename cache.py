@@ -0,0 +1,124 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from integrator import FrameIntegrator
+
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deterministic-chaos", "trajectories")
+
+
+class TrajectoryCache:
+    """
+    LRU cache of calculated trajectories.
+
+    Trajectories are keyed by the system, its parameters, the starting point and
+    solver settings. Replaying a cached trajectory needs no integration; once
+    playback runs past the cached frames, integration continues from the last
+    cached point and new frames are added to the entry.
+
+    memory_budget - bytes kept in memory, least recently used entries are evicted first;
+    disk_budget - bytes of evicted entries kept in cache_dir, 0 disables the disk cache;
+    max_frames - frames recorded per trajectory, later frames are only played;
+    entries - OrderedDict of key -> list of (frames, 3) chunks, the most recently used last;
+    """
+    def __init__(self, memory_budget=128 * 2**20, disk_budget=0, cache_dir=CACHE_DIR,
+                 max_frames=200000):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.cache_dir = cache_dir
+        self.max_frames = max_frames
+        self.entries = OrderedDict()
+        self.memory = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(eq, state=None):
+        return (type(eq).__name__, tuple(sorted(eq.params.items())),
+                tuple(float(value) for value in (eq.history.last if state is None else state)),
+                eq.method, eq.time_scale, eq.rk_step)
+
+    def disk_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".npy")
+
+    def get(self, key):
+        """
+        Returns list of cached chunks of the trajectory, empty if there are none.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return list(self.entries[key])
+            path = self.disk_path(key)
+            if self.disk_budget > 0 and os.path.exists(path):
+                os.utime(path)
+                chunk = np.load(path)
+                self.entries[key] = [chunk]
+                self.memory += chunk.nbytes
+                self.evict()
+                return [chunk]
+            return []
+
+    def append(self, key, chunk, start):
+        """
+        Adds chunk of frames beginning at frame start, unless the entry has
+        been evicted meanwhile and no longer ends right before it.
+        """
+        with self.lock:
+            chunks = self.entries.get(key, [])
+            if sum(len(cached) for cached in chunks) != start:
+                return
+            self.entries[key] = chunks + [chunk]
+            self.entries.move_to_end(key)
+            self.memory += chunk.nbytes
+            self.evict()
+
+    def evict(self):
+        while self.memory > self.memory_budget and len(self.entries) > 1:
+            key, chunks = self.entries.popitem(last=False)
+            self.memory -= sum(chunk.nbytes for chunk in chunks)
+            if self.disk_budget > 0:
+                self.spill(key, np.concatenate(chunks))
+
+    def spill(self, key, trajectory):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        np.save(self.disk_path(key), trajectory)
+        files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        files.sort(key=os.path.getmtime)
+        used = sum(os.path.getsize(path) for path in files)
+        for path in files:
+            if used <= self.disk_budget:
+                break
+            used -= os.path.getsize(path)
+            os.remove(path)
+
+    def frames(self, eq, chunk_size=250, state=None):
+        """
+        Returns frame sequence of eq starting at state (its last point by default),
+        replayed from the cache as far as possible.
+        """
+        key = self.key(eq, state)
+        return self.replay(eq, key, self.get(key), chunk_size, state)
+
+    def replay(self, eq, key, chunks, chunk_size, state=None):
+        recorded = 0
+        for chunk in chunks:
+            for x, y, z in chunk:
+                yield x, y, z
+            recorded += len(chunk)
+
+        state = chunks[-1][-1] if chunks else state
+        integrator = FrameIntegrator(eq, chunk_size, start=recorded, state=state)
+        while True:
+            try:
+                chunk = np.ascontiguousarray(integrator.next_chunk())
+            except StopIteration:
+                return
+            # Parameters may be edited before the sequence is replaced,
+            # such frames must not be stored under the old key.
+            if recorded < self.max_frames and tuple(sorted(eq.params.items())) == key[1]:
+                self.append(key, chunk, recorded)
+                recorded += len(chunk)
+            for x, y, z in chunk:
+                yield x, y, z
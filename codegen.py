@@ -0,0 +1,188 @@
+import ast
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+import numpy as np
+
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deterministic-chaos", "systems")
+# Increased whenever the generated code changes, so that old files are not loaded.
+VERSION = 3
+VARIABLES = ("x", "y", "z")
+# RK4 steps of every point of an ensemble, in parallel threads.
+ENSEMBLE = """\
+def ensemble(state, p, h, substeps):
+    out = numpy.empty_like(state)
+    for i in prange(state.shape[1]):
+        x, y, z = state[0, i], state[1, i], state[2, i]
+        for _ in range(substeps):
+            ax, ay, az = kernel((x, y, z), p)
+            bx, by, bz = kernel((x + h / 2 * ax, y + h / 2 * ay, z + h / 2 * az), p)
+            cx, cy, cz = kernel((x + h / 2 * bx, y + h / 2 * by, z + h / 2 * bz), p)
+            dx, dy, dz = kernel((x + h * cx, y + h * cy, z + h * cz), p)
+            x += h / 6 * (ax + 2 * bx + 2 * cx + dx)
+            y += h / 6 * (ay + 2 * by + 2 * cy + dy)
+            z += h / 6 * (az + 2 * bz + 2 * cz + dz)
+        out[0, i] = x
+        out[1, i] = y
+        out[2, i] = z
+    return out
+
+
+"""
+# RK4 steps of a point together with its tangent vectors q, evolving by dq/dt = J q.
+VARIATIONAL = """\
+def tangent(x, y, z, q, p):
+    j = jacobian_kernel((x, y, z), p)
+    out = numpy.empty_like(q)
+    for k in range(q.shape[1]):
+        out[0, k] = j[0][0] * q[0, k] + j[0][1] * q[1, k] + j[0][2] * q[2, k]
+        out[1, k] = j[1][0] * q[0, k] + j[1][1] * q[1, k] + j[1][2] * q[2, k]
+        out[2, k] = j[2][0] * q[0, k] + j[2][1] * q[1, k] + j[2][2] * q[2, k]
+    return out
+
+
+def variational(state, q, p, h, substeps):
+    x, y, z = state[0], state[1], state[2]
+    for _ in range(substeps):
+        ax, ay, az = kernel((x, y, z), p)
+        qa = tangent_kernel(x, y, z, q, p)
+        bx, by, bz = kernel((x + h / 2 * ax, y + h / 2 * ay, z + h / 2 * az), p)
+        qb = tangent_kernel(x + h / 2 * ax, y + h / 2 * ay, z + h / 2 * az, q + h / 2 * qa, p)
+        cx, cy, cz = kernel((x + h / 2 * bx, y + h / 2 * by, z + h / 2 * bz), p)
+        qc = tangent_kernel(x + h / 2 * bx, y + h / 2 * by, z + h / 2 * bz, q + h / 2 * qb, p)
+        dx, dy, dz = kernel((x + h * cx, y + h * cy, z + h * cz), p)
+        qd = tangent_kernel(x + h * cx, y + h * cy, z + h * cz, q + h * qc, p)
+        x += h / 6 * (ax + 2 * bx + 2 * cx + dx)
+        y += h / 6 * (ay + 2 * by + 2 * cy + dy)
+        z += h / 6 * (az + 2 * bz + 2 * cz + dz)
+        q = q + h / 6 * (qa + 2 * qb + 2 * qc + qd)
+    return numpy.array((x, y, z)), q
+
+
+"""
+
+
+def generate(name, equations, params, definitions=None, jacobian=None):
+    """
+    Returns source of a module with the right-hand side of a declared system:
+
+    derivatives(state, p) - (dx, dy, dz), vectorized over the coordinates of state
+                            and over parameters p, packed in the order of params;
+    kernel - derivatives compiled by Numba (if installed);
+    ensemble_kernel(state, p, h, substeps) - (3, N) points after substeps RK4 steps of size h
+                                             from (3, N) state, compiled by Numba and parallel
+                                             over the points, None without Numba;
+    jacobian(state, p) - rows of the Jacobian matrix, from given 3x3 expressions or derived
+                         by SymPy, None if neither is available (ANALYTIC is then False);
+    variational_kernel(state, q, p, h, substeps) - (3,) point and (3, k) tangent vectors after
+                                                   substeps RK4 steps of size h, compiled by Numba
+                                                   (if installed), None without jacobian;
+    """
+    definitions = definitions or {}
+    unpack = ["    x, y, z = state[0], state[1], state[2]\n"]
+    if params:
+        unpack.append("    %s = %s\n" % (", ".join(params), ", ".join("p[%d]" % i for i in range(len(params)))))
+    lines = ["# Generated from the declaration of %s in equation.py, do not edit.\n" % name,
+             "import numpy\n",
+             "from numpy import sin, cos, tan, exp, log, sqrt, tanh, sign\n",
+             "from kernels import NUMBA, njit, prange\n\n\n",
+             "def derivatives(state, p):\n"]
+    lines += unpack
+    lines += ["    %s = %s\n" % item for item in definitions.items()]
+    # Constant components are broadcast to the shape of the state.
+    lines.append("    return (%s)\n\n\n" % ", ".join(
+        expression if depends_on_state(expression, definitions) else "%s + 0 * x" % expression
+        for expression in equations))
+
+    if jacobian is None:
+        jacobian = derive_jacobian(equations, params, definitions)
+    if jacobian is None:
+        lines.append("jacobian = None\nvariational_kernel = None\nANALYTIC = False\n")
+    else:
+        lines.append("def jacobian(state, p):\n")
+        lines += unpack
+        lines.append("    return (%s)\n\n\n" % ",\n            ".join(
+            "(%s)" % ", ".join(row) for row in jacobian))
+        lines.append(VARIATIONAL)
+        lines.append("ANALYTIC = True\n")
+    lines.append(ENSEMBLE)
+    lines.append("kernel = njit(cache=True)(derivatives)\n"
+                 # In pure Python the loop over the points would be slower than NumPy.
+                 "ensemble_kernel = njit(cache=True, parallel=True, nogil=True)(ensemble) if NUMBA else None\n")
+    if jacobian is not None:
+        lines.append("jacobian_kernel = njit(cache=True)(jacobian)\n"
+                     "tangent_kernel = njit(cache=True)(tangent)\n"
+                     "variational_kernel = njit(cache=True, nogil=True)(variational)\n")
+    return "".join(lines)
+
+
+def depends_on_state(expression, definitions):
+    names = {node.id for node in ast.walk(ast.parse(expression)) if isinstance(node, ast.Name)}
+    return any(name in VARIABLES or name in definitions for name in names)
+
+
+def derive_jacobian(equations, params, definitions):
+    """
+    Returns 3x3 nested list with source of partial derivatives, None without SymPy.
+    """
+    try:
+        import sympy
+        from sympy.printing.numpy import NumPyPrinter
+    except ImportError:
+        return None
+    symbols = {name: sympy.Symbol(name, real=True) for name in VARIABLES + tuple(params)}
+    symbols.update({"abs": sympy.Abs})
+    for name, expression in (definitions or {}).items():
+        symbols[name] = sympy.sympify(expression, locals=symbols)
+    printer = NumPyPrinter({"fully_qualified_modules": True})
+    return [[printer.doprint(sympy.diff(sympy.sympify(expression, locals=symbols), symbols[variable]))
+             for variable in VARIABLES]
+            for expression in equations]
+
+
+def load(name, equations, params, definitions=None, jacobian=None, cache_dir=CACHE_DIR):
+    """
+    Returns module generated for a declared system, see generate.
+    Modules are written to cache_dir once and imported from there later, so
+    neither SymPy nor Numba has to redo its work at startup.
+    """
+    jacobian = None if jacobian is None else tuple(map(tuple, jacobian))
+    analytic = jacobian is not None or importlib.util.find_spec("sympy") is not None
+    key = repr((VERSION, name, tuple(equations), tuple(params), sorted((definitions or {}).items()),
+                jacobian, analytic))
+    module_name = "%s_%s" % (name, hashlib.sha1(key.encode()).hexdigest()[:12])
+    path = os.path.join(cache_dir, module_name + ".py")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        source = generate(name, equations, params, definitions, jacobian)
+        # Other processes may be generating the same module, so it is replaced atomically.
+        descriptor, temporary = tempfile.mkstemp(suffix=".py", dir=cache_dir)
+        with os.fdopen(descriptor, "w", encoding="utf-8") as file:
+            file.write(source)
+        os.replace(temporary, path)
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Numba finds cached kernels through the module, so it has to be importable by name.
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def numeric_jacobian(derivatives, state, p, step=1e-7):
+    """
+    Returns rows of the Jacobian matrix approximated by central differences,
+    used for systems declared without a Jacobian when SymPy is not available.
+    """
+    state = np.asarray(state, dtype=float)
+    columns = []
+    for i in range(3):
+        h = step * np.maximum(1., np.abs(state[i]))
+        forward, backward = state.copy(), state.copy()
+        forward[i] += h
+        backward[i] -= h
+        columns.append((np.asarray(derivatives(forward, p)) - np.asarray(derivatives(backward, p))) / (2 * h))
+    return [[columns[j][i] for j in range(3)] for i in range(3)]
@@ -0,0 +1,58 @@
+import numpy as np
+from history import PROJECTIONS
+
+
+class Density:
+    """
+    Fixed-size 2-D histograms of visited points in all three projections.
+
+    Each point is binned once for every projection, so switching axes needs
+    no recalculation. Memory depends only on the number of bins, points
+    outside the limits of a projection are not counted in it.
+
+    bins - number of bins along every coordinate;
+    low, high - limits of x, y and z;
+    counts - (3, bins, bins) histograms, counts[axes][row, column] with rows
+             along the second and columns along the first visible coordinate;
+    peak - highest count of every projection;
+    """
+    def __init__(self, xlim, ylim, zlim, bins=300):
+        self.bins = bins
+        self.low = np.array((xlim[0], ylim[0], zlim[0]), dtype=float)
+        self.high = np.array((xlim[1], ylim[1], zlim[1]), dtype=float)
+        self.counts = np.zeros((3, bins, bins))
+        self.peak = np.zeros(3)
+
+    def clear(self):
+        self.counts[:] = 0
+        self.peak[:] = 0
+
+    def add(self, point):
+        index = np.floor((np.asarray(point) - self.low) * (self.bins / (self.high - self.low)))
+        inside = (index >= 0) & (index < self.bins)
+        for axes in range(3):
+            if np.all(inside[PROJECTIONS[axes]]):
+                column, row = index[PROJECTIONS[axes]].astype(int)
+                self.counts[axes, row, column] += 1
+                self.peak[axes] = max(self.peak[axes], self.counts[axes, row, column])
+
+    def extend(self, points):
+        index = np.floor((np.asarray(points) - self.low) * (self.bins / (self.high - self.low)))
+        inside = (index >= 0) & (index < self.bins)
+        for axes in range(3):
+            # A point outside the limits of one coordinate is still visible in the projection without it.
+            visible = np.all(inside[:, PROJECTIONS[axes]], axis=1)
+            column, row = index[visible][:, PROJECTIONS[axes]].astype(int).T
+            flat = np.bincount(row * self.bins + column, minlength=self.bins ** 2)
+            self.counts[axes] += flat.reshape(self.bins, self.bins)
+            self.peak[axes] = self.counts[axes].max()
+
+    def image(self, axes):
+        return self.counts[axes]
+
+    def extent(self, axes):
+        """
+        Returns (left, right, bottom, top) limits of the histogram of given axes for imshow.
+        """
+        first, second = np.arange(3)[PROJECTIONS[axes]]
+        return self.low[first], self.high[first], self.low[second], self.high[second]
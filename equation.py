@@ -1,322 +1,369 @@
-import itertools
 import numpy as np
-from scipy.integrate import solve_ivp
+import codegen
+from integrator import FrameIntegrator, EnsembleIntegrator
+from history import History
+from profiler import metrics
+
+
+def jacobian_matrix(rows):
+    """
+    Stacks 3x3 nested list of scalars and arrays into one array,
+    broadcasting all entries to a common shape.
+    """
+    entries = np.broadcast_arrays(*[entry for row in rows for entry in row])
+    return np.reshape(entries, (3, 3) + entries[0].shape)
 
 
 class Equation:
     """
     Base class for a system of equations.
 
-    x, y, z - history of calculated points;
+    history - ring buffer of calculated points, see history.History;
+    x, y, z - views of the calculated coordinates;
+    default_state - initial conditions used when none are given;
+    initial - initial conditions of the current trajectory;
+    trace_length - maximum number of remembered points;
     axes - currently visible axes (0 - x&y, 1 - y&z, 2 - x&z);
     xlim, ylim, zlim - limits of the visible coordinate system;
     params - dictionary containing all parameters of the system of equations;
+    time_scale - frame i is calculated at time i / time_scale;
+    method - solve_ivp integration method or 'RK4' for the native fixed-step integrator;
+    kernel - native right-hand side kernel(state, p), see codegen.generate, None if there is none;
+    variational_kernel - native kernel integrating tangent vectors, see codegen.generate,
+                         None if there is none;
+    ensemble_kernel - native kernel integrating ensembles, see codegen.generate, None if there is none;
+    rk_step - largest step of the fixed-step integrator used for ensembles;
+    density - histograms of the trajectory, see density.Density, None if not collected;
+    section - Poincaré section (coordinate, value, direction), plane coordinate = value crossed
+              with increasing (1), decreasing (-1) or any (0) coordinate, coordinate 0 - x, 1 - y, 2 - z;
+    crossings - History of points on the section, None if not collected;
+    recorder - recording.Recorder saving every new point, None if not recording;
     """
     def __init__(self):
-        self.x = [0]
-        self.y = [0]
-        self.z = [0]
+        self.trace_length = 50000
+        self.density = None
+        self.crossings = None
+        self.recorder = None
+        self.section = (2, 0., 1)
+        self.default_state = (0., 0., 0.)
+        self.set_initial_conditions()
         self.axes = 0
         self.xlim = (-10, 10)
         self.ylim = (-10, 10)
         self.zlim = (-10, 10)
         self.params = dict()
+        self.time_scale = 1
+        self.method = 'RK45'
+        self.kernel = None
+        self.variational_kernel = None
+        self.ensemble_kernel = None
+        self.rk_step = 0.01
 
     def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [0]
-        self.y = [y] if y else [0]
-        self.z = [z] if z else [0]
-
-    def data_gen(self):
-        yield 0, 0, 0
-
-    def update(self, data):
-        x, y, z = data
-        self.x.append(x)
-        self.y.append(y)
-        self.z.append(z)
-        return x, y, z
-
-    def __str__(self):
-        return "Equation"
-
-    @staticmethod
-    def text_equation():
-        return ""
-
-
-class LorenzSystem(Equation):
-    def __init__(self):
-        super().__init__()
-        self.x = [1.]
-        self.y = [1.]
-        self.z = [1.]
-
-        self.xlim = (-22, 22)
-        self.ylim = (-30, 30)
-        self.zlim = (-5, 55)
-
-        self.params = {"rho": 28.0,         # 28.0
-                       "sigma": 10.0,       # 10.0
-                       "beta": 8.0 / 5.0}   # 8.0 / 3.0
-
-    def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [1.]
-        self.y = [y] if y else [1.]
-        self.z = [z] if z else [1.]
-
-    def derivatives(self, _, state):
-        x, y, z = state
-        dx = self.params["sigma"] * (y - x)
-        dy = x * (self.params["rho"] - z) - y
-        dz = x * y - self.params["beta"] * z
-        return dx, dy, dz
-
-    def data_gen(self):
-        for cnt in itertools.count():
-            i = cnt
-            state = [self.x[-1], self.y[-1], self.z[-1]]
-            sol = solve_ivp(self.derivatives, [i/40, (i+1)/40], state)
-            yield sol.y[0, 1], sol.y[1, 1], sol.y[2, 1]
-
-    def __str__(self):
-        return "Lorenz system"
-
-    @staticmethod
-    def text_equation():
-        return "Lorenz system:\n" \
-               "dx/dt = sigma * (y-x)\n" \
-               "dy/dt = x * (rho - z) - y\n" \
-               "dz/dt = xy - beta * z"
-
-
-class RosslerSystem(Equation):
-    def __init__(self):
-        super().__init__()
-        self.x = [0.0]
-        self.y = [0.0]
-        self.z = [0.0]
-
-        self.xlim = (-15, 15)
-        self.ylim = (-15, 10)
-        self.zlim = (-3, 25)
-
-        self.params = {"a": 0.2,  # 0.2
-                       "b": 0.2,  # 0.2
-                       "c": 5.7}  # 5.7
-
-    def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [0.]
-        self.y = [y] if y else [0.]
-        self.z = [z] if z else [0.]
+        """
+        Starts a new trajectory. The previous history is left untouched,
+        so it can still be drawn as a shadow.
+        """
+        x0, y0, z0 = self.default_state
+        self.initial = (x0 if x is None else x, y0 if y is None else y, z0 if z is None else z)
+        self.history = History(self.trace_length)
+        self.history.append(self.initial)
+        if self.density is not None:
+            self.density.clear()
+            self.density.add(self.initial)
+        if self.crossings is not None:
+            self.collect_crossings(self.crossings.capacity)
+
+    def collect_crossings(self, capacity=20000):
+        """
+        Starts collecting crossings of the section, see integrator.section_event.
+        """
+        self.crossings = History(capacity, pyramid=False)
+
+    def set_trace_length(self, length):
+        history = History(length)
+        history.extend(self.history.points)
+        self.history = history
+        self.trace_length = length
+
+    @property
+    def x(self):
+        return self.history.x
+
+    @property
+    def y(self):
+        return self.history.y
+
+    @property
+    def z(self):
+        return self.history.z
 
     def derivatives(self, _, state):
-        x, y, z = state
-        dx = -y - z
-        dy = x + self.params["a"] * y
-        dz = self.params["b"] + z * (x - self.params["c"])
-        return dx, dy, dz
+        return np.zeros_like(state)
+
+    def jacobian(self, state):
+        """
+        Returns Jacobian matrix of derivatives at state, (3, 3, N) for (3, N) states.
+        """
+        return np.zeros((3,) + np.shape(state))
+
+    def param_array(self):
+        return np.array(list(self.params.values()), dtype=float)
+
+    def rhs(self):
+        """
+        Returns the right-hand side for solve_ivp, using the native kernel if there is one.
+        Parameters are packed once, so later changes need a new call.
+        """
+        if self.kernel is None:
+            return self.derivatives
+        kernel, p = self.kernel, self.param_array()
+        return lambda _, state: kernel(state, p)
+
+    def rk_substeps(self):
+        """
+        Returns (h, n) - size and number of fixed steps making up one frame.
+        """
+        frame_dt = 1 / self.time_scale
+        n = max(1, int(np.ceil(frame_dt / self.rk_step)))
+        return frame_dt / n, n
 
     def data_gen(self):
-        for cnt in itertools.count():
-            i = cnt
-            state = [self.x[-1], self.y[-1], self.z[-1]]
-            sol = solve_ivp(self.derivatives, [i/10, (i+1)/10], state, method='DOP853')
-            yield sol.y[0, 1], sol.y[1, 1], sol.y[2, 1]
-
-    def __str__(self):
-        return "Rössler system"
-
-    @staticmethod
-    def text_equation():
-        return "Rössler system:\n" \
-               "dx/dt = -y - z\n" \
-               "dy/dt = x + ay\n" \
-               "dz/dt = b + z(x - c)"
-
-
-class ChuaCircuit(Equation):
-    def __init__(self):
-        super().__init__()
-        self.x = [0.1]
-        self.y = [0.1]
-        self.z = [0.1]
-
-        self.xlim = (-3, 3)
-        self.ylim = (-2, 2)
-        self.zlim = (-6, 6)
+        return FrameIntegrator(self)
 
-        self.params = {"alpha": 15.395,  # 15.395
-                       "beta": 28.}      # 28.
+    def initial_cloud(self, n=10000, spread=1e-3):
+        """
+        Returns (n, 3) array of points scattered around the last calculated point.
+        """
+        return self.history.last + spread * np.random.default_rng().standard_normal((n, 3))
 
-    def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [0.1]
-        self.y = [y] if y else [0.1]
-        self.z = [z] if z else [0.1]
-
-    @staticmethod
-    def f(x):
-        return -0.714*x - 0.2145*(abs(x+1) - abs(x-1))
+    def ensemble_gen(self, initial):
+        return EnsembleIntegrator(self, initial)
 
-    def derivatives(self, _, state):
-        x, y, z = state
-        dx = self.params["alpha"] * (y - x - self.f(x))
-        dy = x - y + z
-        dz = -self.params["beta"] * y
-        return dx, dy, dz
-
-    def data_gen(self):
-        for cnt in itertools.count():
-            i = cnt
-            state = [self.x[-1], self.y[-1], self.z[-1]]
-            sol = solve_ivp(self.derivatives, [i, (i+1)], state)
-            yield sol.y[0, 1], sol.y[1, 1], sol.y[2, 1]
+    def update(self, data):
+        with metrics.timer("history"):
+            self.history.append(data)
+            if self.density is not None:
+                self.density.add(data)
+            if self.recorder is not None:
+                self.recorder.append(data)
+            # Crossings come with the first frame after them, see integrator.Frame.
+            crossings = getattr(data, "crossings", None)
+            if crossings is not None and self.crossings is not None:
+                self.crossings.extend(crossings)
+        return data
 
     def __str__(self):
-        return "Chua's circuit"
+        return "Equation"
 
     @staticmethod
     def text_equation():
-        return "Chua's circuit:\n" \
-               "dx/dt = alpha * (y - x - f(x))\n" \
-               "dy/dt = x - y + z\n" \
-               "dz/dt = -beta * y\n\n" \
-               "f(x) = -0.714x-0.2145(|x+1|-|x-1|)"
-
-
-class ChenSystem(Equation):
-    def __init__(self):
-        super().__init__()
-        self.x = [-0.1]
-        self.y = [0.5]
-        self.z = [-0.6]
-
-        self.xlim = (-25, 30)
-        self.ylim = (-30, 35)
-        self.zlim = (-10, 45)
-
-        self.params = {"a": 40.,  # 40.
-                       "b": 3.,   # 3.
-                       "c": 28.}  # 28.
-
-    def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [-0.1]
-        self.y = [y] if y else [0.5]
-        self.z = [z] if z else [-0.6]
-
-    def derivatives(self, _, state):
-        x, y, z = state
-        dx = self.params["a"] * (y - x)
-        dy = (self.params["c"] - self.params["a"]) * x - x*z + self.params["c"]*y
-        dz = x * y - self.params["b"] * z
-        return dx, dy, dz
-
-    def data_gen(self):
-        for cnt in itertools.count():
-            i = cnt
-            state = [self.x[-1], self.y[-1], self.z[-1]]
-            sol = solve_ivp(self.derivatives, [i/50, (i+1)/50], state)
-            yield sol.y[0, 1], sol.y[1, 1], sol.y[2, 1]
-
-    def __str__(self):
-        return "Chen system"
+        return ""
 
-    @staticmethod
-    def text_equation():
-        return "Chen system:\n" \
-               "dx/dt = a(y - x)\n" \
-               "dy/dt = (c-a)x - xz + cy\n" \
-               "dz/dt = xy - bz"
 
+class System(Equation):
+    """
+    System of equations generated from its declaration, see declare.
+
+    Right-hand side, native kernel and Jacobian come from a module generated
+    by codegen.load when the first instance of the class is created.
+    Parameters are passed to them as a tuple, without dictionary lookups.
+
+    title - name shown in the window;
+    equations - expressions of dx/dt, dy/dt and dz/dt;
+    definitions - helper expressions used in the equations;
+    partials - rows of expressions of the Jacobian matrix, derived by SymPy (or approximated
+               by finite differences without it) if None;
+    declaration - params, initial state, limits and solver settings;
+    generated - generated module, None until the first instance is created;
+    """
+    title = "Equation"
+    equations = ("0", "0", "0")
+    definitions = dict()
+    partials = None
+    declaration = dict()
+    text = None
+    generated = None
 
-class ThomasSystem(Equation):
     def __init__(self):
         super().__init__()
-        self.x = [1.1]
-        self.y = [1.1]
-        self.z = [-0.01]
-
-        self.xlim = (-5, 5)
-        self.ylim = (-5, 5)
-        self.zlim = (-5, 5)
-
-        self.params = {"b": 0.208186}
-
-    def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [1.1]
-        self.y = [y] if y else [1.1]
-        self.z = [z] if z else [-0.01]
+        cls = type(self)
+        if cls.generated is None:
+            cls.generated = codegen.load(cls.__name__, cls.equations, list(cls.declaration["params"]),
+                                         cls.definitions, cls.partials)
+        declaration = self.declaration
+        self.default_state = declaration["initial"]
+        self.set_initial_conditions()
+        self.xlim = declaration["xlim"]
+        self.ylim = declaration["ylim"]
+        self.zlim = declaration["zlim"]
+        self.params = dict(declaration["params"])
+        self.section = declaration["section"]
+        self.time_scale = declaration["time_scale"]
+        self.method = declaration["method"]
+        self.rk_step = declaration["rk_step"]
+        self.kernel = self.generated.kernel
+        self.variational_kernel = self.generated.variational_kernel
+        self.ensemble_kernel = self.generated.ensemble_kernel
 
     def derivatives(self, _, state):
-        x, y, z = state
-        dx = np.sin(y) - self.params["b"] * x
-        dy = np.sin(z) - self.params["b"] * y
-        dz = np.sin(x) - self.params["b"] * z
-        return dx, dy, dz
+        return self.generated.derivatives(state, tuple(self.params.values()))
 
-    def data_gen(self):
-        for cnt in itertools.count():
-            i = cnt
-            state = [self.x[-1], self.y[-1], self.z[-1]]
-            sol = solve_ivp(self.derivatives, [i, (i+1)], state, method='DOP853')
-            yield sol.y[0, 1], sol.y[1, 1], sol.y[2, 1]
+    def jacobian(self, state):
+        p = tuple(self.params.values())
+        if self.generated.ANALYTIC:
+            return jacobian_matrix(self.generated.jacobian(state, p))
+        return jacobian_matrix(codegen.numeric_jacobian(self.generated.derivatives, state, p))
 
     def __str__(self):
-        return "Thomas system"
-
-    @staticmethod
-    def text_equation():
-        return "Thomas system:\n" \
-               "dx/dt = sin(y) - bx\n" \
-               "dy/dt = sin(z) - by\n" \
-               "dz/dt = sin(x) - bz"
+        return self.title
 
+    def text_equation(self):
+        if self.text is not None:
+            return self.text
+        lines = ["%s:" % self.title]
+        lines += ["d%s/dt = %s" % item for item in zip(codegen.VARIABLES, self.equations)]
+        if self.definitions:
+            lines.append("")
+            lines += ["%s = %s" % item for item in self.definitions.items()]
+        return "\n".join(lines)
 
-class AizawaSystem(Equation):
-    def __init__(self):
-        super().__init__()
-        self.x = [0.1]
-        self.y = [1.00]
-        self.z = [0.01]
 
-        self.xlim = (-2.5, 2.5)
-        self.ylim = (-2.5, 2.5)
-        self.zlim = (-2.5, 2.5)
+SYSTEMS = []
 
-        self.params = {"a": 0.95,
-                       "b": 0.7,
-                       "c": 0.6,
-                       "d": 3.5,
-                       "e": 0.25,
-                       "f": 0.1}
 
-    def set_initial_conditions(self, x=None, y=None, z=None):
-        self.x = [x] if x else [0.1]
-        self.y = [y] if y else [1.00]
-        self.z = [z] if z else [0.01]
-
-    def derivatives(self, _, state):
-        x, y, z = state
-        dx = (z - self.params["b"]) * x - self.params["d"] * y
-        dy = self.params["d"] * x + (z - self.params["b"]) * y
-        dz = self.params["c"] + self.params["a"]*z - z**3 / 3 \
-            - (x*x + y*y) * (1 + self.params["e"]*z) + self.params["f"]*z * x**3
-        return dx, dy, dz
-
-    def data_gen(self):
-        for cnt in itertools.count():
-            i = cnt
-            state = [self.x[-1], self.y[-1], self.z[-1]]
-            sol = solve_ivp(self.derivatives, [i, (i+1)], state)
-            yield sol.y[0, 1], sol.y[1, 1], sol.y[2, 1]
-
-    def __str__(self):
-        return "Aizawa system"
+def declare(name, title, equations, params, initial, xlim, ylim, zlim, time_scale=1, method='RK45',
+            rk_step=0.01, section=(2, 0., 1), definitions=None, jacobian=None, text=None):
+    """
+    Declares a system of equations and registers it in SYSTEMS, which also lists it in the window.
+
+    equations - Python expressions of dx/dt, dy/dt and dz/dt, which may use x, y, z, params,
+                names of definitions and numpy functions sin, cos, tan, exp, log, sqrt, tanh, sign;
+    params - default values of parameters;
+    definitions - helper expressions, e.g. {"f": "..."};
+    jacobian - 3x3 expressions of partial derivatives d(dx/dt)/dx, d(dx/dt)/dy, ..., row by row,
+               exact and independent of SymPy, derived by SymPy if not given;
+    text - description shown in the window, made of the equations by default;
+    The other arguments set attributes of Equation. Returns the new subclass of System.
+    """
+    cls = type(name, (System,), {
+        "__module__": __name__,
+        "title": title,
+        "equations": tuple(equations),
+        "definitions": dict(definitions or {}),
+        "partials": None if jacobian is None else tuple(map(tuple, jacobian)),
+        "declaration": dict(params=params, initial=initial, xlim=xlim, ylim=ylim, zlim=zlim,
+                            time_scale=time_scale, method=method, rk_step=rk_step, section=section),
+        "text": text,
+    })
+    SYSTEMS.append(cls)
+    return cls
+
+
+LorenzSystem = declare(
+    "LorenzSystem", "Lorenz system",
+    equations=("sigma * (y - x)",
+               "x * (rho - z) - y",
+               "x * y - beta * z"),
+    jacobian=(("-sigma", "sigma", "0"),
+              ("rho - z", "-1", "-x"),
+              ("y", "x", "-beta")),
+    params={"rho": 28.0,        # 28.0
+            "sigma": 10.0,      # 10.0
+            "beta": 8.0 / 5.0},  # 8.0 / 3.0
+    initial=(1., 1., 1.), xlim=(-22, 22), ylim=(-30, 30), zlim=(-5, 55),
+    time_scale=40, section=(2, 27., 1))
+
+RosslerSystem = declare(
+    "RosslerSystem", "Rössler system",
+    equations=("-y - z",
+               "x + a * y",
+               "b + z * (x - c)"),
+    jacobian=(("0", "-1", "-1"),
+              ("1", "a", "0"),
+              ("z", "0", "x - c")),
+    params={"a": 0.2,  # 0.2
+            "b": 0.2,  # 0.2
+            "c": 5.7},  # 5.7
+    initial=(0.0, 0.0, 0.0), xlim=(-15, 15), ylim=(-15, 10), zlim=(-3, 25),
+    time_scale=10, method='DOP853', section=(0, 0., 1))
+
+ChuaCircuit = declare(
+    "ChuaCircuit", "Chua's circuit",
+    equations=("alpha * (y - x - f)",
+               "x - y + z",
+               "-beta * y"),
+    definitions={"f": "-0.714 * x - 0.2145 * (abs(x + 1) - abs(x - 1))"},
+    jacobian=(("-alpha * (1 - 0.714 - 0.2145 * (sign(x + 1) - sign(x - 1)))", "alpha", "0"),
+              ("1", "-1", "1"),
+              ("0", "-beta", "0")),
+    params={"alpha": 15.395,  # 15.395
+            "beta": 28.},     # 28.
+    initial=(0.1, 0.1, 0.1), xlim=(-3, 3), ylim=(-2, 2), zlim=(-6, 6),
+    # Frames used to be the first step of solve_ivp over a whole time unit, 0.048 on average.
+    time_scale=20, section=(1, 0., 1))
+
+ChenSystem = declare(
+    "ChenSystem", "Chen system",
+    equations=("a * (y - x)",
+               "(c - a) * x - x * z + c * y",
+               "x * y - b * z"),
+    jacobian=(("-a", "a", "0"),
+              ("c - a - z", "c", "-x"),
+              ("y", "x", "-b")),
+    params={"a": 40.,  # 40.
+            "b": 3.,   # 3.
+            "c": 28.},  # 28.
+    initial=(-0.1, 0.5, -0.6), xlim=(-25, 30), ylim=(-30, 35), zlim=(-10, 45),
+    time_scale=50, section=(2, 16., 1))
+
+ThomasSystem = declare(
+    "ThomasSystem", "Thomas system",
+    equations=("sin(y) - b * x",
+               "sin(z) - b * y",
+               "sin(x) - b * z"),
+    jacobian=(("-b", "cos(y)", "0"),
+              ("0", "-b", "cos(z)"),
+              ("cos(x)", "0", "-b")),
+    params={"b": 0.208186},
+    initial=(1.1, 1.1, -0.01), xlim=(-5, 5), ylim=(-5, 5), zlim=(-5, 5),
+    # Frames used to be the first step of solve_ivp over a whole time unit, 0.25 on average.
+    time_scale=4, method='DOP853', rk_step=0.05, section=(0, 0., 1))
+
+AizawaSystem = declare(
+    "AizawaSystem", "Aizawa system",
+    equations=("(z - b) * x - d * y",
+               "d * x + (z - b) * y",
+               "c + a * z - z * z * z / 3 - (x * x + y * y) * (1 + e * z) + f * z * x * x * x"),
+    jacobian=(("z - b", "-d", "x"),
+              ("d", "z - b", "y"),
+              ("-2 * x * (1 + e * z) + 3 * f * z * x * x", "-2 * y * (1 + e * z)",
+               "a - z * z - e * (x * x + y * y) + f * x * x * x")),
+    params={"a": 0.95,
+            "b": 0.7,
+            "c": 0.6,
+            "d": 3.5,
+            "e": 0.25,
+            "f": 0.1},
+    initial=(0.1, 1.00, 0.01), xlim=(-2.5, 2.5), ylim=(-2.5, 2.5), zlim=(-2.5, 2.5),
+    # Frames used to be the first step of solve_ivp over a whole time unit, 0.050 on average.
+    time_scale=20, rk_step=0.02, section=(0, 0., 1),
+    text="Aizawa system:\n"
+         "dx/dt = (z-b)x - dy\n"
+         "dy/dt = dx + (z-b)y\n"
+         "dz/dt = c + az - (z^3)/3 -\n"
+         " -(x^2 + y^2)(1+ez) + fzx^3")
+
+
+def by_name(name):
+    """
+    Returns a new equation whose class name or title starts with given name,
+    e.g. "lorenz", "LorenzSystem" or "Lorenz system" (case-insensitive).
+    """
+    def key(text):
+        return "".join(c for c in text.lower().replace("ö", "o") if c.isalnum())
 
-    @staticmethod
-    def text_equation():
-        return "Aizawa system:\n" \
-               "dx/dt = (z-b)x - dy\n" \
-               "dy/dt = dx + (z-b)y\n" \
-               "dz/dt = c + az - (z^3)/3 -\n"\
-               " -(x^2 + y^2)(1+ez) + fzx^3"
+    for cls in SYSTEMS:
+        if key(cls.__name__).startswith(key(name)) or key(cls.title).startswith(key(name)):
+            return cls()
+    raise KeyError(name)
@@ -0,0 +1,180 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import equation
+from batch import set_equation, integrate_to_file
+
+
+VIEWS = ("xy", "yz", "xz", "3d")
+VIDEO = (".mp4", ".gif", ".webm", ".mov", ".avi")
+# Frames per second of the animation in the window, see Window.create_plot.
+# Every frame of the window shows one more calculated point.
+WINDOW_FPS = 50
+
+
+def frame_end(j, speed):
+    """
+    Returns index of the last calculated point shown in video frame j (or an array of them),
+    speed being the number of points per frame, which does not have to be whole.
+    """
+    return np.rint((np.asarray(j) + 1) * speed).astype(int)
+
+
+def render_frames(system, params, view, size, dpi, trajectory, speed, first, count, pattern=None):
+    """
+    Renders video frames first..first + count - 1 of a trajectory saved by
+    batch.integrate_to_file with the same Plot as the window, frame j showing
+    its points up to frame_end(j, speed). Returns list of (height, width, 4) RGBA
+    arrays, or saves them as PNG files named pattern % j if pattern is given.
+    Runs in a worker process.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.image import imsave
+    from plot import Plot, Plot3D
+    eq = equation.by_name(system)
+    eq.params.update(params)
+    points = np.load(trajectory, mmap_mode="r")
+    fig = Figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    plot = Plot3D(eq, fig) if view == "3d" else Plot(eq, fig)
+    plot.set_animated(False)
+    if view != "3d":
+        eq.axes = VIEWS.index(view)
+        plot.change_axes(eq.axes)
+
+    eq.set_initial_conditions(*points[0])
+    shown = frame_end(first - 1, speed)
+    eq.history.extend(points[1:shown + 1])
+    images = []
+    for j in range(first, first + count):
+        end = frame_end(j, speed)
+        eq.history.extend(points[shown + 1:end])
+        plot.animate(tuple(points[end]))
+        shown = end
+        canvas.draw()
+        image = np.array(canvas.buffer_rgba())
+        if pattern is not None:
+            imsave(pattern % j, image)
+        else:
+            images.append(image)
+    return images
+
+
+def open_encoder(ffmpeg, output, width, height, fps):
+    """
+    Starts ffmpeg reading raw RGBA frames from its stdin.
+    """
+    command = [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+               "-s", "%dx%d" % (width, height), "-r", str(fps), "-i", "-"]
+    if output.lower().endswith(".gif"):
+        command += ["-vf", "split[a][b];[a]palettegen[p];[b][p]paletteuse"]
+    else:
+        # Most players need 4:2:0 chroma, which needs even dimensions.
+        command += ["-vf", "crop=trunc(iw/2)*2:trunc(ih/2)*2", "-pix_fmt", "yuv420p"]
+    return subprocess.Popen(command + [output], stdin=subprocess.PIPE)
+
+
+def export(eq, output, frames, fps=30, speed=None, view="xy", size=(1280, 720), dpi=100,
+           batch=16, workers=None, report=None):
+    """
+    Exports animation of eq starting at its last point to a video file (through ffmpeg)
+    or to a directory of PNG files, which is also used when ffmpeg is not installed.
+
+    The trajectory is integrated once, to a temporary memory-mapped file. Batches
+    of frames are rendered in parallel by a process pool and written in order,
+    with at most two batches per process waiting, so memory use stays bounded.
+    Without speed, the video plays at the pace of the window, WINDOW_FPS points
+    per second, above WINDOW_FPS fps it shows one point per frame and plays slower.
+    Returns the path of the video file or of the PNG directory.
+    """
+    speed = speed or max(1., WINDOW_FPS / fps)
+    ffmpeg = encoder = pattern = None
+    if output.lower().endswith(VIDEO):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            output = os.path.splitext(output)[0] + "_frames"
+            print("ffmpeg not found, saving PNG frames to %s" % output, file=sys.stderr)
+    if ffmpeg is None:
+        os.makedirs(output, exist_ok=True)
+        pattern = os.path.join(output, "frame_%05d.png")
+
+    params = {name: float(value) for name, value in eq.params.items()}
+    with tempfile.TemporaryDirectory() as directory:
+        trajectory = os.path.join(directory, "trajectory.npy")
+        steps = integrate_to_file(eq, trajectory, frame_end(frames - 1, speed) / eq.time_scale,
+                                  1 / eq.time_scale, eq.method)
+        # A failed solver leaves the trajectory shorter.
+        frames = int(np.searchsorted(frame_end(np.arange(frames), speed), steps, side="right"))
+        done = 0
+        with ProcessPoolExecutor(workers) as pool:
+            pending = deque()
+            limit = 2 * (workers or os.cpu_count() or 1)
+            for first in range(0, frames, batch):
+                pending.append(pool.submit(render_frames, type(eq).__name__, params, view, size, dpi,
+                                           trajectory, speed, first, min(batch, frames - first), pattern))
+                last = first + batch >= frames
+                while pending and (len(pending) >= limit or last):
+                    images = pending.popleft().result()
+                    if ffmpeg is not None:
+                        if encoder is None:
+                            # Agg rounds the figure size, so the frames tell the real one.
+                            encoder = open_encoder(ffmpeg, output, images[0].shape[1], images[0].shape[0], fps)
+                        try:
+                            for image in images:
+                                encoder.stdin.write(image.tobytes())
+                        except BrokenPipeError:
+                            raise RuntimeError("ffmpeg failed with exit code %d" % encoder.wait()) from None
+                    done = min(frames, done + batch)
+                    if report is not None:
+                        report(done, frames)
+    if encoder is not None:
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        if encoder.wait() != 0:
+            raise RuntimeError("ffmpeg failed with exit code %d" % encoder.returncode)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export an animation of a system to a video or PNG files.")
+    parser.add_argument("system", help="system name, e.g. lorenz")
+    parser.add_argument("output", help=".mp4/.gif/.webm/.mov/.avi video (needs ffmpeg) or a directory for PNG files")
+    parser.add_argument("--duration", type=float, default=10., help="length of the video in seconds")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--speed", type=float, default=None,
+                        help="calculated points per video frame, may be fractional, "
+                             "50 / fps (the pace of the window) by default")
+    parser.add_argument("--view", choices=VIEWS, default="xy")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 720), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="change a parameter of the system, may be repeated")
+    parser.add_argument("--initial", type=float, nargs=3, metavar=("X", "Y", "Z"),
+                        help="initial conditions, system defaults if not given")
+    parser.add_argument("--workers", type=int, default=None, help="processes, all cores by default")
+    args = parser.parse_args(argv)
+    set_equation(parser, args)
+
+    def report(done, frames):
+        print("\r%d / %d frames" % (done, frames), end="", file=sys.stderr)
+
+    start = time.perf_counter()
+    frames = int(round(args.duration * args.fps))
+    output = export(args.equation, args.output, frames, args.fps, args.speed, args.view, args.size,
+                    args.dpi, workers=args.workers, report=report)
+    print(file=sys.stderr)
+    print("%d frames saved to %s in %.2f s" % (frames, output, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
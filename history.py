@@ -0,0 +1,207 @@
+import numpy as np
+
+
+# Columns shown on each of the visible axes (0 - x&y, 1 - y&z, 2 - x&z).
+# Basic slices, so that indexing with them returns views, not copies.
+PROJECTIONS = (slice(0, 2), slice(1, 3), slice(0, 3, 2))
+# Column of every coordinate.
+COORDINATES = {"x": 0, "y": 1, "z": 2}
+# Smallest level of the pyramid of a History.
+MIN_LEVEL = 256
+
+
+class History:
+    """
+    Preallocated ring buffer of calculated points.
+
+    Every point is written twice, at i and i + capacity, so the stored
+    points always form one contiguous block of the array and all views
+    returned by this class are zero-copy.
+
+    Every 2**k-th point is also stored in level k of a pyramid of smaller
+    buffers covering the same span, so long histories can be drawn with
+    a bounded number of points, see downsampled.
+
+    capacity - maximum number of stored points, the oldest are dropped first;
+    data - (2 * capacity, 3) float64 array;
+    start - index of the oldest stored point;
+    size - number of stored points;
+    count - number of points appended so far;
+    levels - coarser histories, levels[k - 1] holds every 2**k-th point;
+    low, high - bounds of all appended points;
+    path - summed absolute steps between consecutive points along every axis;
+    """
+    def __init__(self, capacity=50000, pyramid=True):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, 3))
+        self.start = 0
+        self.size = 0
+        self.count = 0
+        self.levels = []
+        if pyramid:
+            k = 1
+            while capacity >> k >= MIN_LEVEL:
+                self.levels.append(History(-(-capacity >> k), pyramid=False))
+                k += 1
+        self.low = np.full(3, np.inf)
+        self.high = np.full(3, -np.inf)
+        self.path = np.zeros(3)
+
+    def __len__(self):
+        return self.size
+
+    def append(self, point):
+        if self.size > 0:
+            self.path += np.abs(point - self.last)
+        if self.size < self.capacity:
+            i = self.size
+            self.size += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.data[i] = point
+        self.data[i + self.capacity] = point
+        np.minimum(self.low, point, out=self.low)
+        np.maximum(self.high, point, out=self.high)
+        for k, level in enumerate(self.levels, 1):
+            if self.count % (1 << k):
+                break
+            level.append(point)
+        self.count += 1
+
+    def extend(self, points):
+        """
+        Appends points at once, same as appending them one by one.
+        """
+        points = np.asarray(points, dtype=float)
+        total = len(points)
+        if total == 0:
+            return
+        if self.size > 0:
+            self.path += np.abs(points[0] - self.last)
+        self.path += np.abs(np.diff(points, axis=0)).sum(axis=0)
+        np.minimum(self.low, points.min(axis=0), out=self.low)
+        np.maximum(self.high, points.max(axis=0), out=self.high)
+        for k, level in enumerate(self.levels, 1):
+            level.extend(points[-self.count % (1 << k)::1 << k])
+        # Only the last capacity points are kept, but all of them are counted.
+        points = points[-self.capacity:]
+        n = len(points)
+        if self.size + n <= self.capacity:
+            self.data[self.size:self.size + n] = points
+            self.data[self.capacity + self.size:self.capacity + self.size + n] = points
+            self.size += n
+        else:
+            # The buffer is rewritten from the start, the kept points followed by the new ones.
+            kept = self.points[self.size - (self.capacity - n):].copy() if n < self.capacity else points[:0]
+            self.data[:self.capacity] = np.concatenate((kept, points))
+            self.data[self.capacity:] = self.data[:self.capacity]
+            self.start = 0
+            self.size = self.capacity
+        self.count += total
+
+    @property
+    def points(self):
+        return self.data[self.start:self.start + self.size]
+
+    @property
+    def last(self):
+        return self.data[self.start + self.size - 1]
+
+    @property
+    def x(self):
+        return self.points[:, 0]
+
+    @property
+    def y(self):
+        return self.points[:, 1]
+
+    @property
+    def z(self):
+        return self.points[:, 2]
+
+    def projection(self, axes):
+        """
+        Returns (2, size) view with the coordinates visible on given axes.
+        """
+        return self.points[:, PROJECTIONS[axes]].T
+
+    def spacing(self, columns, scale):
+        """
+        Returns average distance between consecutive points of given columns,
+        each one multiplied by its scale, e.g. pixels per unit.
+        """
+        return np.linalg.norm(self.path[columns] * scale) / max(1, self.count - 1)
+
+    def recent(self, spacing, length):
+        """
+        Returns number of the newest points forming a line of about given length,
+        spacing being the average distance between them.
+        """
+        if spacing * self.size <= length:
+            return self.size
+        return max(1, int(length / spacing))
+
+    def downsampled(self, axes, xlim, ylim, pixels, line=24, fill=1 / 16):
+        """
+        Returns (older, newest) (2, n) projections of the stored points reduced to
+        what can be seen in a view of given limits and (width, height) in pixels.
+
+        The newest points are kept at full resolution, to be drawn as a line, as many
+        as form a line about line times as long as the width plus the height of the view,
+        so short histories are drawn as a line only. Agg's cost of a line grows with its length
+        in pixels, so older ones are meant to be drawn as unconnected pixels, whose cost
+        only grows with their number. They come from the coarsest level whose points
+        are still about a pixel apart, points far outside the limits are skipped
+        (with NaN gaps), and at most fill of the pixels of the view of them are
+        returned, so the cost of drawing does not grow with the history.
+        """
+        columns = np.arange(3)[PROJECTIONS[axes]]
+        limits = np.array((xlim, ylim), dtype=float)
+        scale = np.asarray(pixels, dtype=float) / np.abs(limits[:, 1] - limits[:, 0])
+        spacing = self.spacing(columns, scale)
+        recent = self.recent(spacing, line * (pixels[0] + pixels[1]))
+        newest = self.points[self.size - recent:, columns].T
+        if self.size - recent <= 0:
+            return np.empty((2, 0)), newest
+        budget = max(1, int(pixels[0] * pixels[1] * fill))
+        k = 0
+        while k < len(self.levels) and spacing * (2 << k) <= 1:
+            k += 1
+        clip = bool(np.any(self.low[columns] < limits.min(axis=1)) or
+                    np.any(self.high[columns] > limits.max(axis=1)))
+
+        older = self.older(k, self.count - recent)[:, columns]
+        if clip:
+            older = clip_to_view(older, limits)
+        while len(older) > budget and k < len(self.levels):
+            k += 1
+            older = self.older(k, self.count - recent)[:, columns]
+            if clip:
+                older = clip_to_view(older, limits)
+        return older.T, newest
+
+    def older(self, k, end):
+        """
+        Returns points of level k (0 is this history) appended before the end-th point.
+        """
+        if k == 0:
+            return self.points[:max(0, end - (self.count - self.size))]
+        level = self.levels[k - 1]
+        newer = level.count - -(-end >> k)
+        return level.points[:max(0, level.size - newer)]
+
+
+def clip_to_view(points, limits):
+    """
+    Drops (n, 2) points of a line which are not visible within limits, keeping
+    the neighbours of visible ones, and separates the remaining runs by NaN rows.
+    """
+    low, high = limits.min(axis=1), limits.max(axis=1)
+    inside = np.all((points >= low) & (points <= high), axis=1)
+    keep = inside.copy()
+    keep[1:] |= inside[:-1]
+    keep[:-1] |= inside[1:]
+    index = np.flatnonzero(keep)
+    gaps = np.flatnonzero(np.diff(index) > 1) + 1
+    return np.insert(points[index], gaps, np.nan, axis=0)
@@ -0,0 +1,218 @@
+import time
+import numpy as np
+from kernels import fixed_step_integrator
+from profiler import metrics
+
+
+class FrameIntegrator:
+    """
+    Iterator over animation frames of an equation.
+
+    Instead of calling solve_ivp once per frame, a single call integrates
+    a whole chunk of frames, which are then served from a buffer.
+    With method 'RK4' chunks are calculated by the native fixed-step kernel.
+    Frame i is evaluated exactly at time (i + 1) / time_scale.
+    While the equation collects crossings of its Poincaré section, they are
+    located by solve_ivp events (DOP853 stands in for 'RK4') and carried by
+    the first frame after them (see Frame), so Equation.update adds them only
+    when the trajectory reaches them. next_chunk returns points only.
+
+    equation - integrated system of equations;
+    chunk_size - number of frames calculated at once;
+    frame - index of the next frame to yield;
+    state - last calculated point, starting point of the next chunk,
+            the last point of the equation's history by default;
+    events - dictionary of buffer position -> (n, 3) crossings found before that frame;
+    """
+    def __init__(self, eq, chunk_size=250, start=0, state=None):
+        self.equation = eq
+        self.chunk_size = chunk_size
+        self.frame = start
+        self.state = np.array(eq.history.last if state is None else state, dtype=float)
+        self.buffer = np.empty((0, 3))
+        self.position = 0
+        self.events = dict()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position >= len(self.buffer):
+            self.refill()
+        x, y, z = self.buffer[self.position]
+        crossings = self.events.pop(self.position, None)
+        self.position += 1
+        self.frame += 1
+        if crossings is not None:
+            return Frame((x, y, z), crossings)
+        return x, y, z
+
+    def next_chunk(self):
+        """
+        Returns all frames left in the buffer, or the next whole chunk if it is empty.
+        """
+        if self.position >= len(self.buffer):
+            self.refill()
+        chunk = self.buffer[self.position:]
+        self.position = len(self.buffer)
+        self.frame += len(chunk)
+        return chunk
+
+    def refill(self):
+        self.events = dict()
+        if self.equation.method == 'RK4' and self.equation.crossings is None:
+            self.buffer = self.fixed_step_chunk()
+        else:
+            self.buffer = self.solve_ivp_chunk()
+        if len(self.buffer) == 0:
+            raise StopIteration
+        self.state = self.buffer[-1]
+        self.position = 0
+
+    def solve_ivp_chunk(self):
+        # Imported on first use, as SciPy takes longer to import than everything else.
+        from scipy.integrate import solve_ivp
+        eq = self.equation
+        frames = np.arange(self.frame, self.frame + self.chunk_size + 1)
+        t_eval = frames / eq.time_scale
+        method = 'DOP853' if eq.method == 'RK4' else eq.method
+        events = None if eq.crossings is None else section_event(*eq.section)
+        if not metrics.enabled:
+            sol = solve_ivp(eq.rhs(), (t_eval[0], t_eval[-1]), self.state,
+                            method=method, t_eval=t_eval[1:], events=events)
+            if events is not None:
+                self.add_events(sol, t_eval[1:])
+            return sol.y.T
+
+        start = time.perf_counter()
+        sol, steps, rejected = solve_counted(eq.rhs(), (t_eval[0], t_eval[-1]), self.state,
+                                             method, t_eval[1:], events)
+        if events is not None:
+            self.add_events(sol, t_eval[1:])
+        count = max(1, sol.y.shape[1])
+        metrics.add("integration", (time.perf_counter() - start) * 1e3 / count)
+        metrics.add("nfev", sol.nfev / count)
+        metrics.add("steps", steps / count)
+        if rejected is not None:
+            metrics.add("rejected", rejected / count)
+        return sol.y.T
+
+    def add_events(self, sol, t_eval):
+        """
+        Assigns crossings found by solve_ivp to the first frames at or after them.
+        """
+        positions = np.searchsorted(t_eval, sol.t_events[0])
+        for position in np.unique(positions):
+            self.events[position] = sol.y_events[0][positions == position]
+
+    def fixed_step_chunk(self):
+        eq = self.equation
+        integrate = fixed_step_integrator(eq.kernel)
+        h, substeps = eq.rk_substeps()
+        start = time.perf_counter()
+        points = integrate(self.state, eq.param_array(), h, substeps, self.chunk_size)
+        # Recorded per frame, as by solve_ivp_chunk.
+        metrics.add("integration", (time.perf_counter() - start) * 1e3 / max(1, len(points)))
+        return points
+
+
+class Frame(tuple):
+    """
+    Point (x, y, z) of a frame which also carries (n, 3) crossings of the
+    Poincaré section found since the previous frame.
+    """
+    def __new__(cls, point, crossings):
+        frame = super().__new__(cls, point)
+        frame.crossings = crossings
+        return frame
+
+
+def section_event(coordinate, value, direction=0):
+    """
+    Returns solve_ivp event function of crossing the plane coordinate = value,
+    see Equation.section.
+    """
+    def crossing(_, state):
+        return state[coordinate] - value
+
+    crossing.direction = direction
+    return crossing
+
+
+def solve_counted(fun, t_span, y0, method, t_eval, events=None):
+    """
+    solve_ivp which also returns the number of accepted steps and, for explicit
+    Runge-Kutta methods, the number of rejected ones (None for other methods).
+    """
+    import scipy.integrate
+    from scipy.integrate import solve_ivp
+    base = getattr(scipy.integrate, method)
+    counts = {"steps": 0, "dense": 0}
+
+    class CountingSolver(base):
+        def step(self):
+            counts["steps"] += 1
+            return super().step()
+
+        def dense_output(self):
+            counts["dense"] += 1
+            return super().dense_output()
+
+    sol = solve_ivp(fun, t_span, y0, method=CountingSolver, t_eval=t_eval, events=events)
+    rejected = None
+    # Only explicit Runge-Kutta methods (RK23, RK45, DOP853) have a fixed number of stages.
+    n_stages = getattr(base, "n_stages", None)
+    if n_stages is not None:
+        # Every attempted step costs n_stages evaluations, plus 2 to select the first step.
+        # DOP853 needs 3 more for each dense output used to evaluate t_eval points.
+        extra = 3 * counts["dense"] if base is scipy.integrate.DOP853 else 0
+        attempts = (sol.nfev - 2 - extra) // n_stages
+        rejected = attempts - counts["steps"]
+    return sol, counts["steps"], rejected
+
+
+def rk4_step(f, t, y, h):
+    """Single classic Runge-Kutta step of size h for y' = f(t, y)."""
+    k1 = f(t, y)
+    k2 = f(t + h / 2, y + h / 2 * k1)
+    k3 = f(t + h / 2, y + h / 2 * k2)
+    k4 = f(t + h, y + h * k3)
+    return y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+class EnsembleIntegrator:
+    """
+    Iterator advancing many initial conditions of one equation at once.
+
+    Points are kept as a (3, N) array and advanced by the native ensemble
+    kernel of the equation, in parallel threads. Without one, or with parameters
+    given as arrays (one value per point), the derivatives are evaluated for the
+    whole ensemble with vectorized NumPy operations instead.
+    Every frame is made of fixed-size RK4 steps not longer than rk_step.
+    Yields (N, 3) views of the current points.
+    """
+    def __init__(self, eq, initial, start=0):
+        self.equation = eq
+        self.frame = start
+        self.state = np.array(initial, dtype=float).T.copy()
+        self.h, self.substeps = eq.rk_substeps()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        eq = self.equation
+        if eq.ensemble_kernel is not None and all(np.ndim(value) == 0 for value in eq.params.values()):
+            self.state = eq.ensemble_kernel(self.state, eq.param_array(), self.h, self.substeps)
+            self.frame += 1
+            return self.state.T
+        t = self.frame / eq.time_scale
+        with np.errstate(over='ignore', invalid='ignore'):
+            for _ in range(self.substeps):
+                self.state = rk4_step(self.rhs, t, self.state, self.h)
+                t += self.h
+        self.frame += 1
+        return self.state.T
+
+    def rhs(self, t, state):
+        return np.asarray(self.equation.derivatives(t, state))
@@ -0,0 +1,69 @@
+import importlib.util
+from functools import lru_cache
+import numpy as np
+
+
+NUMBA = importlib.util.find_spec("numba") is not None
+
+
+def njit(*args, **kwargs):
+    """
+    Numba's njit, imported on first use, or a pure-Python fallback
+    used when Numba is not installed.
+    """
+    if NUMBA:
+        import numba
+        return numba.njit(*args, **kwargs)
+    if len(args) == 1 and callable(args[0]):
+        return args[0]
+    return lambda func: func
+
+
+def __getattr__(name):
+    """
+    Numba's prange, imported on first use (from kernels import prange) like njit,
+    or range when Numba is not installed.
+    """
+    if name == "prange":
+        if NUMBA:
+            import numba
+            return numba.prange
+        return range
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def set_threads(n):
+    """
+    Limits the number of threads of parallel kernels started by the calling thread.
+    """
+    if NUMBA:
+        import numba
+        numba.set_num_threads(n)
+
+
+@lru_cache(maxsize=None)
+def fixed_step_integrator(rhs):
+    """
+    Returns a kernel integrating given right-hand side with fixed RK4 steps:
+
+    integrate(state, p, h, substeps, frames) - (frames, 3) array of points,
+    each one substeps steps of size h after the previous one.
+    """
+    @njit(nogil=True)
+    def integrate(state, p, h, substeps, frames):
+        out = np.empty((frames, 3))
+        x, y, z = state[0], state[1], state[2]
+        for i in range(frames):
+            for _ in range(substeps):
+                ax, ay, az = rhs((x, y, z), p)
+                bx, by, bz = rhs((x + h / 2 * ax, y + h / 2 * ay, z + h / 2 * az), p)
+                cx, cy, cz = rhs((x + h / 2 * bx, y + h / 2 * by, z + h / 2 * bz), p)
+                dx, dy, dz = rhs((x + h * cx, y + h * cy, z + h * cz), p)
+                x += h / 6 * (ax + 2 * bx + 2 * cx + dx)
+                y += h / 6 * (ay + 2 * by + 2 * cy + dy)
+                z += h / 6 * (az + 2 * bz + 2 * cz + dz)
+            out[i, 0] = x
+            out[i, 1] = y
+            out[i, 2] = z
+        return out
+    return integrate
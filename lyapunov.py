@@ -0,0 +1,186 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+import equation
+from batch import system_by_name, check_param
+
+
+def variational_step(eq, state, q, h):
+    """
+    Single RK4 step of size h of the trajectory together with its tangent vectors.
+
+    state - (3, N) points;
+    q - (3, k, N) tangent vectors, evolving by dq/dt = J(state) q;
+    """
+    def f(s, v):
+        return np.asarray(eq.derivatives(0, s)), np.einsum('ijn,jkn->ikn', eq.jacobian(s), v)
+
+    k1s, k1v = f(state, q)
+    k2s, k2v = f(state + h / 2 * k1s, q + h / 2 * k1v)
+    k3s, k3v = f(state + h / 2 * k2s, q + h / 2 * k2v)
+    k4s, k4v = f(state + h * k3s, q + h * k3v)
+    return (state + h / 6 * (k1s + 2 * k2s + 2 * k3s + k4s),
+            q + h / 6 * (k1v + 2 * k2v + 2 * k3v + k4v))
+
+
+def renormalize(q):
+    """
+    Orthonormalizes tangent vectors by QR decomposition.
+    Returns new (3, k, N) vectors and (k, N) logarithms of their stretching.
+    """
+    orthonormal, r = np.linalg.qr(np.moveaxis(q, 2, 0))
+    logs = np.log(np.abs(np.diagonal(r, axis1=1, axis2=2))).T
+    return np.moveaxis(orthonormal, 0, 2), logs
+
+
+class LyapunovEstimator:
+    """
+    Running estimate of the Lyapunov exponents of an equation.
+
+    Fed with consecutive frames of a trajectory, it integrates the variational
+    equation over every frame interval, using the analytic Jacobian of the system,
+    and re-orthonormalizes tangent vectors by QR decomposition after each frame.
+    Systems with a native variational kernel are integrated by it, so the estimate
+    costs a small fraction of a frame.
+
+    n - number of estimated exponents, 1 for the largest one only;
+    sums - accumulated logarithms of stretching of the tangent vectors;
+    time - length of the trajectory processed so far;
+    state - last processed point, the last point of the equation's history by default;
+    """
+    def __init__(self, eq, n=3, state=None):
+        self.equation = eq
+        self.state = np.reshape(eq.history.last if state is None else state, (3, 1)).astype(float)
+        self.q = np.eye(3)[:, :n, np.newaxis].copy()
+        self.sums = np.zeros(n)
+        self.time = 0.
+        self.h, self.substeps = eq.rk_substeps()
+        self.kernel = eq.variational_kernel
+        self.p = eq.param_array()
+
+    @property
+    def exponents(self):
+        if self.time == 0:
+            return np.zeros_like(self.sums)
+        return self.sums / self.time
+
+    def update(self, point):
+        """
+        Processes the interval between the previous frame and the given one.
+        """
+        state, q = self.state, self.q
+        if self.kernel is not None:
+            _, q = self.kernel(state[:, 0], q[:, :, 0], self.p, self.h, self.substeps)
+            q = q[:, :, np.newaxis]
+        else:
+            for _ in range(self.substeps):
+                state, q = variational_step(self.equation, state, q, self.h)
+        self.q, logs = renormalize(q)
+        self.sums += logs[:, 0]
+        self.time += self.h * self.substeps
+        self.state = np.reshape(point, (3, 1)).astype(float)
+
+    def track(self, frame_seq):
+        """
+        Passes frames through unchanged, updating the estimate on the way.
+        """
+        for point in frame_seq:
+            self.update(point)
+            yield point
+
+
+def lyapunov_exponents(eq, duration, transient, n=3, size=1):
+    """
+    Estimates Lyapunov exponents of size copies of the equation started at its
+    last point, all integrated at once. Parameters of eq may be arrays of that size.
+    Returns (size, n) array.
+    """
+    h, substeps = eq.rk_substeps()
+    frame_dt = h * substeps
+    state = np.repeat(np.reshape(eq.history.last, (3, 1)), size, axis=1)
+    frames = eq.ensemble_gen(state.T)
+    for _ in range(int(round(transient / frame_dt))):
+        state = next(frames).T
+    state = np.array(state)
+
+    q = np.repeat(np.eye(3)[:, :n, np.newaxis], size, axis=2)
+    sums = np.zeros((n, size))
+    frames_count = int(round((duration - transient) / frame_dt))
+    with np.errstate(all='ignore'):
+        for _ in range(frames_count):
+            for _ in range(substeps):
+                state, q = variational_step(eq, state, q, h)
+            q, logs = renormalize(np.nan_to_num(q))
+            sums += logs
+    return (sums / (frames_count * frame_dt)).T
+
+
+def lyapunov_row(system, params, param, values, duration, transient, n):
+    """
+    Estimates Lyapunov exponents for all values of one parameter at once,
+    with the parameter stored as an array, so that the whole row is vectorized.
+    Returns (len(values), n) array. Runs in a worker process.
+    """
+    eq = equation.by_name(system)
+    # Parameters are packed in the order of the dictionary, an unknown one would be ignored.
+    if param not in eq.params:
+        raise KeyError(param)
+    eq.params.update(params)
+    eq.params[param] = np.asarray(values, dtype=float)
+    return lyapunov_exponents(eq, duration, transient, n, len(values))
+
+
+def lyapunov_grid(system, param_x, values_x, param_y, values_y, duration=200., transient=50.,
+                  n=1, workers=None):
+    """
+    Maps Lyapunov exponents over a 2-D grid of parameter values.
+    Rows of the grid are calculated in parallel, each one vectorized.
+    Returns (len(values_y), len(values_x), n) array.
+    """
+    with ProcessPoolExecutor(workers) as pool:
+        rows = pool.map(lyapunov_row, repeat(system), [{param_y: float(v)} for v in values_y],
+                        repeat(param_x), repeat(np.asarray(values_x)), repeat(duration),
+                        repeat(transient), repeat(n))
+        return np.stack(list(rows))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate Lyapunov exponents of a system.")
+    parser.add_argument("system", help="system name, e.g. lorenz")
+    parser.add_argument("--duration", type=float, default=200.)
+    parser.add_argument("--transient", type=float, default=50.)
+    parser.add_argument("--n", type=int, default=3, help="number of exponents")
+    parser.add_argument("--grid", nargs=8, metavar=("PX", "START", "STOP", "NX", "PY", "START", "STOP", "NY"),
+                        help="map the exponents over a grid of two parameters")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="lyapunov.png", help="grid output, .png/.pdf image or .npy array")
+    args = parser.parse_args(argv)
+    eq = system_by_name(parser, args.system)
+
+    if args.grid is None:
+        exponents = lyapunov_exponents(eq, args.duration, args.transient, args.n)[0]
+        print("Lyapunov exponents:", ", ".join("%.4f" % value for value in exponents))
+        return
+
+    param_x, param_y = args.grid[0], args.grid[4]
+    check_param(parser, eq, param_x)
+    check_param(parser, eq, param_y)
+    try:
+        values_x = np.linspace(float(args.grid[1]), float(args.grid[2]), int(args.grid[3]))
+        values_y = np.linspace(float(args.grid[5]), float(args.grid[6]), int(args.grid[7]))
+    except ValueError:
+        parser.error("--grid expects PX START STOP NX PY START STOP NY, with numbers of values NX and NY")
+    grid = lyapunov_grid(args.system, param_x, values_x, param_y, values_y,
+                         args.duration, args.transient, args.n, args.workers)
+    if args.output.endswith(".npy"):
+        np.save(args.output, grid)
+    else:
+        from plot import MapPlot
+        extent = (values_x[0], values_x[-1], values_y[0], values_y[-1])
+        MapPlot(grid[:, :, 0], extent, str(eq) + " - largest Lyapunov exponent",
+                param_x, param_y, "λ₁").fig.savefig(args.output, dpi=150)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,42 @@
+import argparse
 import tkinter as tk
-from plot import Plot
-from window import Window
+import equation
+from window import Window, ComparisonWindow
+from profiler import metrics
+
+
+def parse_system(text):
+    """
+    Returns equation described as SYSTEM[:NAME=VALUE,...], e.g. "lorenz:rho=20,beta=2".
+    """
+    name, _, params = text.partition(":")
+    try:
+        eq = equation.by_name(name)
+    except KeyError:
+        raise argparse.ArgumentTypeError("unknown system %r" % name)
+    for param in filter(None, params.split(",")):
+        key, _, value = param.partition("=")
+        if key not in eq.params:
+            raise argparse.ArgumentTypeError("%s has no parameter %r" % (eq, key))
+        eq.params[key] = float(value)
+    return eq
 
 
 if __name__ == "__main__":
-    window = Window(Plot())
+    parser = argparse.ArgumentParser(description="Animated chaotic systems.")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="record performance metrics and save them to a .csv or .json file on exit")
+    parser.add_argument("--compare", nargs="+", type=parse_system, metavar="SYSTEM[:NAME=VALUE,...]",
+                        help="animate several systems side by side, e.g. lorenz lorenz:rho=20 chen")
+    args = parser.parse_args()
+    if args.profile:
+        metrics.enable(record=True)
+    if args.compare:
+        from plot import MultiPlot
+        window = ComparisonWindow(MultiPlot(args.compare))
+    else:
+        # The plot is built when the first system is chosen.
+        window = Window()
     tk.mainloop()
+    if args.profile:
+        metrics.export(args.profile)
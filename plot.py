@@ -1,32 +1,63 @@
+import math
 import matplotlib as mpl
-from matplotlib import pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.colors import LogNorm
 from cycler import cycler
+from density import Density
 from equation import Equation
+from history import PROJECTIONS
+from profiler import metrics
 
 
 class Plot:
     """
     Animated Matplotlib plot.
+
+    In density mode the trace is replaced by log-scaled histograms of the
+    trajectory, see density.Density. The image is static and refreshed with
+    the background every density_refresh frames, as drawing it costs far more
+    than drawing the lines.
+
+    Crossings of the Poincaré section of the equation, when collected,
+    are drawn as points over the trajectory.
+
+    The newest points of the trajectory are drawn as a line (trace), as long as
+    it is quick to draw, older ones as unconnected pixels (outline), reduced to
+    the resolution of the axes, see History.downsampled, so frames of a long
+    history cost about as much as those of a short one.
+
+    Moving artists (line, trace, outline, particles, crossings, hud) are animated, so full redraws skip them
+    and they are drawn over the cached background of static artists (blitting).
+    The plot may be one of the panels of a shared figure, see MultiPlot.
     """
-    def __init__(self, eq=None):
+    projection = None
+
+    def __init__(self, eq=None, fig=None, subplot=(1, 1, 1)):
         mpl.rcParams['axes.prop_cycle'] = cycler(color=['b', 'm', 'k'])
         self.equation = eq if eq is not None else Equation()
-        self.fig = plt.Figure(figsize=(8.5, 6.))
-        self.ax = self.fig.add_subplot(111)
+        self.fig = fig if fig is not None else Figure(figsize=(8.5, 6.))
+        self.ax = self.fig.add_subplot(*subplot, projection=self.projection)
         self.shadow = self.ax.plot([], [], '.-')
+        self.animated = True
+        self.density_refresh = 25
         self.prepare_plot()
 
     def prepare_plot(self):
         self.ax.set(xlim=self.equation.xlim, ylim=self.equation.ylim)
-        self.line, = self.ax.plot([], [], 'o-')
-        self.trace, = self.ax.plot([], [], '-', lw=1, ms=2)
+        self.line, = self.ax.plot([], [], 'o-', animated=self.animated)
+        self.trace, = self.ax.plot([], [], '-', lw=1, ms=2, animated=self.animated)
+        self.outline, = self.ax.plot([], [], ',', color=self.trace.get_color(), animated=self.animated)
         self.ax.set_title(self.equation.__str__())
         self.ax.set_ylabel('y')
         self.ax.set_xlabel('x')
 
-        self.last_x = self.equation.x
-        self.last_y = self.equation.y
-        self.last_z = self.equation.z
+        self.last = self.equation.history
+        self.particles = None
+        self.hud = None
+        self.image = None
+        self.image_age = 0
+        self.crossings = None
+        self.background = None
 
     def change_axes(self, next_a=0):
         if next_a == 0:
@@ -41,21 +72,403 @@ class Plot:
             self.ax.set(xlim=self.equation.xlim, ylim=self.equation.zlim)
             self.ax.set_ylabel('z')
             self.ax.set_xlabel('x')
+        if self.image is not None:
+            self.update_image()
+            self.image.set_extent(self.equation.density.extent(next_a))
+        self.invalidate_background()
 
     def animate(self, i):
-        x, y, z = self.equation.update(i)
-        if self.equation.axes == 0:
-            self.line.set_data(x, y)
-            self.trace.set_data(self.equation.x, self.equation.y)
-        elif self.equation.axes == 1:
-            self.line.set_data(y, z)
-            self.trace.set_data(self.equation.y, self.equation.z)
-        else:
-            self.line.set_data(x, z)
-            self.trace.set_data(self.equation.x, self.equation.z)
+        if self.particles is not None:
+            return self.animate_ensemble(i)
+        self.equation.update(i)
+        if self.image is not None:
+            return self.animate_density() + self.overlays()
+        with metrics.timer("artists"):
+            older, (first, second) = self.visible(self.equation.history)
+            self.line.set_data(first[-1:], second[-1:])
+            self.trace.set_data(first, second)
+            self.outline.set_data(*older)
+        return (self.line, self.outline, self.trace) + self.overlays()
+
+    def overlays(self):
+        """
+        Updates and returns moving artists drawn over the trajectory (crossings, hud).
+        """
+        artists = ()
+        if self.crossings is not None:
+            with metrics.timer("artists"):
+                first, second = self.equation.crossings.projection(self.equation.axes)
+                self.crossings.set_data(first, second)
+            artists += (self.crossings,)
+        if self.hud is not None:
+            artists += (self.hud,)
+        return artists
+
+    def animate_density(self):
+        with metrics.timer("artists"):
+            first, second = self.equation.history.projection(self.equation.axes)
+            self.line.set_data(first[-1:], second[-1:])
+            self.image_age += 1
+            if self.image_age >= self.density_refresh:
+                self.update_image()
+                self.invalidate_background()
         return self.line,
 
+    def update_image(self):
+        self.image_age = 0
+        density = self.equation.density
+        self.image.set_data(density.image(self.equation.axes))
+        self.image.set_clim(1, max(2., density.peak[self.equation.axes]))
+
+    def visible(self, history):
+        """
+        Returns coordinates of (older, newest) points of the history to draw,
+        reduced to the resolution of the axes.
+        """
+        return history.downsampled(self.equation.axes, self.ax.get_xlim(), self.ax.get_ylim(),
+                                   (self.ax.bbox.width, self.ax.bbox.height))
+
+    def draw_shadow(self):
+        """
+        Draws the previous trajectory (last) as a faint line.
+        """
+        for line in self.shadow:
+            line.remove()
+        older, newest = self.visible(self.last)
+        self.shadow = self.ax.plot(*older, 'k,', *newest, 'k-', alpha=0.15)
+        self.invalidate_background()
+
+    def animate_ensemble(self, points):
+        with metrics.timer("artists"):
+            self.particles.set_offsets(points[:, PROJECTIONS[self.equation.axes]])
+        return (self.particles,) + self.overlays()
+
+    def show_ensemble(self):
+        self.line.set_data([], [])
+        self.trace.set_data([], [])
+        self.outline.set_data([], [])
+        self.particles = self.ax.scatter([], [], s=1, c='m', alpha=0.4, linewidths=0,
+                                         animated=self.animated)
+
+    def hide_ensemble(self):
+        if self.particles is not None:
+            self.particles.remove()
+            self.particles = None
+
+    def show_density(self):
+        """
+        Replaces the trace with histograms of the trajectory, starting from its history.
+        """
+        eq = self.equation
+        if eq.density is None:
+            eq.density = Density(eq.xlim, eq.ylim, eq.zlim)
+            eq.density.extend(eq.history.points)
+        if self.image is None:
+            self.trace.set_data([], [])
+            self.outline.set_data([], [])
+            self.image = self.ax.imshow(eq.density.image(eq.axes), extent=eq.density.extent(eq.axes),
+                                        origin='lower', aspect='auto', cmap='magma_r',
+                                        interpolation='nearest', norm=LogNorm(vmin=1, vmax=2))
+            self.update_image()
+
+    def hide_density(self):
+        if self.image is not None:
+            self.image.remove()
+            self.image = None
+        self.equation.density = None
+
+    def show_section(self):
+        if self.equation.crossings is None:
+            self.equation.collect_crossings()
+        if self.crossings is None:
+            self.crossings, = self.ax.plot([], [], '.', color='r', ms=2, animated=self.animated)
+
+    def hide_section(self):
+        if self.crossings is not None:
+            self.crossings.remove()
+            self.crossings = None
+        self.equation.crossings = None
+
+    def show_hud(self):
+        """
+        Shows performance overlay, its text is set by the Animator.
+        """
+        if self.hud is None:
+            self.hud = self.ax.text(0.01, 0.99, "", transform=self.ax.transAxes, va='top',
+                                    family='monospace', fontsize=7, animated=self.animated)
+
+    def hide_hud(self):
+        if self.hud is not None:
+            self.hud.remove()
+            self.hud = None
+
+    def moving_artists(self):
+        artists = (self.line, self.trace, self.outline)
+        if self.particles is not None:
+            artists += (self.particles,)
+        if self.crossings is not None:
+            artists += (self.crossings,)
+        if self.hud is not None:
+            artists += (self.hud,)
+        return artists
+
+    def set_animated(self, animated):
+        self.animated = animated
+        for artist in self.moving_artists():
+            artist.set_animated(animated)
+        self.invalidate_background()
+
+    def invalidate_background(self):
+        """
+        Marks the cached background as outdated after the static content has changed.
+        """
+        self.background = None
+
+    def on_draw(self, _):
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+
+    def blit(self, artists):
+        canvas = self.fig.canvas
+        if self.background is None:
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+        for artist in artists:
+            self.ax.draw_artist(artist)
+        canvas.blit(self.ax.bbox)
+
     def new_equation(self, eq):
+        hud = self.hud is not None
+        density = self.image is not None
+        section = self.crossings is not None
         self.ax.clear()
+        self.equation.density = None
+        self.equation.crossings = None
         self.equation = eq
         self.prepare_plot()
+        if density:
+            self.show_density()
+        if section:
+            self.show_section()
+        if hud:
+            self.show_hud()
+
+
+class Plot3D(Plot):
+    """
+    Animated 3-D Matplotlib plot (mplot3d) of the whole trajectory.
+
+    Lines are given views of the history (and of its pyramid levels) as
+    their vertices, so a new point is written only once, into the history,
+    and nothing is rebuilt from the coordinates each frame. The newest points
+    are drawn at full resolution over a coarse outline of the older ones,
+    unconnected pixels as in Plot, at most fill of the pixels of the axes.
+    Rotating and zooming a paused plot redraws the same vertices.
+
+    With the fading tail only its last points are drawn, in segments of
+    increasing opacity, so the cost of a frame does not depend on the history.
+    The density view is not available in 3-D, changing axes turns the view
+    towards the plane of the chosen pair of coordinates.
+
+    line_length - length of the line of the newest points, relative to the width plus height of the axes;
+    fill - largest number of older points drawn, relative to the pixels of the axes;
+    tail - number of points of the fading tail, None if the whole trajectory is drawn;
+    tail_lines - line of every segment of the tail, the oldest first;
+    """
+    projection = '3d'
+    # Elevation and azimuth looking at the planes x&y, y&z and x&z.
+    VIEWS = ((90., -90.), (0., 0.), (0., -90.))
+
+    def __init__(self, eq=None, fig=None, subplot=(1, 1, 1), tail=None, segments=8):
+        self.line_length = 24
+        self.fill = 1 / 16
+        self.tail = tail
+        self.segments = segments
+        self.tail_lines = []
+        super().__init__(eq, fig, subplot)
+
+    def prepare_plot(self):
+        eq = self.equation
+        self.ax.set(xlim=eq.xlim, ylim=eq.ylim, zlim=eq.zlim)
+        self.line, = self.ax.plot([], [], [], 'o-', animated=self.animated)
+        self.trace, = self.ax.plot([], [], [], '-', lw=1, animated=self.animated)
+        self.outline, = self.ax.plot([], [], [], ',', color=self.trace.get_color(), animated=self.animated)
+        self.ax.set_title(eq.__str__())
+        self.ax.set_xlabel('x')
+        self.ax.set_ylabel('y')
+        self.ax.set_zlabel('z')
+
+        self.last = eq.history
+        self.particles = None
+        self.hud = None
+        self.image = None
+        self.image_age = 0
+        self.crossings = None
+        self.background = None
+        self.tail_lines = []
+        if self.tail is not None:
+            self.show_tail(self.tail)
+
+    def change_axes(self, next_a=0):
+        self.ax.view_init(*self.VIEWS[next_a])
+        self.invalidate_background()
+
+    def animate(self, i):
+        if self.particles is not None:
+            return self.animate_ensemble(i)
+        history = self.equation.history
+        self.equation.update(i)
+        with metrics.timer("artists"):
+            self.line.set_data_3d(*history.points[-1:].T)
+            if self.tail is not None:
+                artists = self.animate_tail(history)
+            else:
+                end = history.count - self.recent(history)
+                k, older = self.coarse(history, end)
+                # The exact part starts at the last point of the outline, so they are joined.
+                start = ((end - 1) >> k << k) - (history.count - history.size) if len(older) else 0
+                self.outline.set_data_3d(*older.T)
+                self.trace.set_data_3d(*history.points[start:].T)
+                artists = (self.outline, self.trace)
+        return (self.line,) + artists + self.overlays()
+
+    def animate_tail(self, history):
+        points = history.points[-self.tail:]
+        bounds = [round(j * len(points) / self.segments) for j in range(self.segments + 1)]
+        for line, begin, end in zip(self.tail_lines, bounds, bounds[1:]):
+            # Every segment shares its first point with the previous one.
+            line.set_data_3d(*points[max(0, begin - 1):end].T)
+        return tuple(self.tail_lines)
+
+    def recent(self, history):
+        """
+        Returns number of the newest points drawn as a line, see History.downsampled.
+        """
+        width, height = self.ax.bbox.width, self.ax.bbox.height
+        scale = [min(width, height) / abs(high - low)
+                 for low, high in (self.ax.get_xlim(), self.ax.get_ylim(), self.ax.get_zlim())]
+        return history.recent(history.spacing(slice(None), scale), self.line_length * (width + height))
+
+    def coarse(self, history, end):
+        """
+        Returns the finest level of history (see History.older) with at most fill of
+        the pixels of the axes of points appended before the end-th point, and these points.
+        """
+        budget = max(1, int(self.ax.bbox.width * self.ax.bbox.height * self.fill))
+        k = 0
+        older = history.older(0, end)
+        while len(older) > budget and k < len(history.levels):
+            k += 1
+            older = history.older(k, end)
+        return k, older
+
+    def draw_shadow(self):
+        for line in self.shadow:
+            line.remove()
+        _, older = self.coarse(self.last, self.last.count)
+        self.shadow = self.ax.plot(*older.T, 'k,', alpha=0.15)
+        self.invalidate_background()
+
+    def show_tail(self, length=2000):
+        """
+        Draws only the last length points, fading out towards the oldest.
+        """
+        self.hide_tail()
+        self.tail = length
+        self.trace.set_data_3d([], [], [])
+        self.outline.set_data_3d([], [], [])
+        color = self.trace.get_color()
+        self.tail_lines = [self.ax.plot([], [], [], '-', lw=1, color=color, alpha=(j + 1) / self.segments,
+                                        animated=self.animated)[0]
+                           for j in range(self.segments)]
+        self.invalidate_background()
+
+    def hide_tail(self):
+        for line in self.tail_lines:
+            line.remove()
+        self.tail_lines = []
+        self.tail = None
+        self.invalidate_background()
+
+    def animate_ensemble(self, points):
+        with metrics.timer("artists"):
+            self.particles.set_data_3d(*points.T)
+        return (self.particles,) + self.overlays()
+
+    def show_ensemble(self):
+        self.line.set_data_3d([], [], [])
+        self.trace.set_data_3d([], [], [])
+        self.outline.set_data_3d([], [], [])
+        for line in self.tail_lines:
+            line.set_data_3d([], [], [])
+        self.particles, = self.ax.plot([], [], [], 'o', ms=1, color='m', alpha=0.4, animated=self.animated)
+
+    def show_density(self):
+        """
+        Raises RuntimeError, histograms are only collected for the 2-D projections.
+        """
+        raise RuntimeError("the density view is only available in 2-D")
+
+    def show_section(self):
+        if self.equation.crossings is None:
+            self.equation.collect_crossings()
+        if self.crossings is None:
+            self.crossings, = self.ax.plot([], [], [], '.', color='r', ms=2, animated=self.animated)
+
+    def overlays(self):
+        artists = ()
+        if self.crossings is not None:
+            with metrics.timer("artists"):
+                self.crossings.set_data_3d(*self.equation.crossings.points.T)
+            artists += (self.crossings,)
+        if self.hud is not None:
+            artists += (self.hud,)
+        return artists
+
+    def show_hud(self):
+        if self.hud is None:
+            self.hud = self.ax.text2D(0.01, 0.99, "", transform=self.ax.transAxes, va='top',
+                                      family='monospace', fontsize=7, animated=self.animated)
+
+    def moving_artists(self):
+        return super().moving_artists() + tuple(self.tail_lines)
+
+
+class MultiPlot:
+    """
+    Grid of animated plots sharing one figure, one panel per equation.
+    Every panel blits only its own axes, see Animator.add.
+    """
+    def __init__(self, equations, columns=None):
+        columns = columns or math.ceil(math.sqrt(len(equations)))
+        rows = math.ceil(len(equations) / columns)
+        self.fig = Figure(figsize=(12., 6.5))
+        self.panels = [Plot(eq, self.fig, (rows, columns, i + 1)) for i, eq in enumerate(equations)]
+        self.fig.tight_layout()
+
+
+class BifurcationPlot:
+    """
+    Static Matplotlib plot of a bifurcation diagram, see sweep.Sweep.
+    """
+    def __init__(self, diagram, title, param, coordinate='x'):
+        self.fig = Figure(figsize=(8.5, 6.))
+        self.ax = self.fig.add_subplot(111)
+        self.points, = self.ax.plot(diagram[:, 0], diagram[:, 1], ',', color='k', alpha=0.5)
+        self.ax.set_title(title + " - bifurcation diagram")
+        self.ax.set_xlabel(param)
+        self.ax.set_ylabel('local maxima of ' + coordinate)
+
+
+class MapPlot:
+    """
+    Static Matplotlib plot of a value mapped over a 2-D grid.
+    """
+    def __init__(self, image, extent, title, xlabel, ylabel, label=''):
+        self.fig = Figure(figsize=(8.5, 6.))
+        self.ax = self.fig.add_subplot(111)
+        self.image = self.ax.imshow(image, extent=extent, origin='lower', aspect='auto', cmap='viridis')
+        self.fig.colorbar(self.image, ax=self.ax, label=label)
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
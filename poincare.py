@@ -0,0 +1,91 @@
+import argparse
+import sys
+import time
+import numpy as np
+from batch import set_equation
+from history import COORDINATES
+from integrator import section_event
+
+
+def collect_crossings(eq, output, count, transient=100., span=100., method="DOP853",
+                      rtol=1e-9, atol=1e-9, report=None):
+    """
+    Streams the first count crossings of eq.section after the transient into
+    a memory-mapped (count, 3) .npy file. Crossings are located by solve_ivp events
+    on the dense output of every step, and integration runs in spans of given
+    time, so memory use does not depend on count.
+    Returns number of found crossings, lower than requested (with zero rows left
+    at the end of the file) if the solver failed or the section is no longer crossed.
+    """
+    # Imported here, SciPy alone takes longer to import than the rest of the program.
+    from scipy.integrate import solve_ivp
+    out = np.lib.format.open_memmap(output, mode="w+", dtype=np.float64, shape=(count, 3))
+    rhs = eq.rhs()
+    event = section_event(*eq.section)
+    state = np.array(eq.history.last, dtype=float)
+    t = 0.
+    if transient > 0:
+        sol = solve_ivp(rhs, (t, transient), state, method=method, rtol=rtol, atol=atol)
+        state, t = sol.y[:, -1], transient
+
+    found = 0
+    empty = 0
+    while found < count and empty < 10:
+        sol = solve_ivp(rhs, (t, t + span), state, method=method, events=event, rtol=rtol, atol=atol)
+        # Without crossings the events come as a (0,) array.
+        points = sol.y_events[0].reshape(-1, 3)[:count - found]
+        out[found:found + len(points)] = points
+        found += len(points)
+        if sol.status == -1:
+            break
+        empty = 0 if len(points) else empty + 1
+        state, t = sol.y[:, -1], t + span
+        out.flush()
+        if report is not None:
+            report(found, count)
+    del out
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Collect crossings of a Poincaré section without GUI and save them to a .npy file.")
+    parser.add_argument("system", help="system name, e.g. lorenz")
+    parser.add_argument("output", help="output .npy file, (crossings, 3) float64 array")
+    parser.add_argument("--crossings", type=int, default=10000, help="number of collected crossings")
+    parser.add_argument("--plane", nargs=2, metavar=("COORDINATE", "VALUE"),
+                        help="section coordinate = value, e.g. z 27, the system's default if not given")
+    parser.add_argument("--direction", type=int, choices=(-1, 0, 1), default=1,
+                        help="count crossings with increasing (1), decreasing (-1) or any (0) coordinate")
+    parser.add_argument("--transient", type=float, default=100., help="time skipped before collecting")
+    parser.add_argument("--span", type=float, default=100., help="time integrated by one solve_ivp call")
+    parser.add_argument("--method", default="DOP853", help="solve_ivp method")
+    parser.add_argument("--rtol", type=float, default=1e-9)
+    parser.add_argument("--atol", type=float, default=1e-9)
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE",
+                        help="change a parameter of the system, may be repeated")
+    parser.add_argument("--initial", type=float, nargs=3, metavar=("X", "Y", "Z"),
+                        help="initial conditions, system defaults if not given")
+    args = parser.parse_args(argv)
+    set_equation(parser, args)
+    eq = args.equation
+    if args.plane is not None:
+        if args.plane[0] not in COORDINATES:
+            parser.error("section coordinate must be one of: x, y, z")
+        eq.section = (COORDINATES[args.plane[0]], float(args.plane[1]), args.direction)
+    else:
+        eq.section = eq.section[:2] + (args.direction,)
+
+    def report(found, count):
+        print("\r%s: %d / %d crossings" % (eq, found, count), end="", file=sys.stderr)
+
+    start = time.perf_counter()
+    found = collect_crossings(eq, args.output, args.crossings, args.transient, args.span, args.method,
+                              args.rtol, args.atol, report)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+    print("%d crossings in %.2f s, %.0f crossings/s" % (found, elapsed, found / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import csv
+import json
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+
+class Metrics:
+    """
+    Rolling measurements of the hot path of the animation.
+
+    Every named metric keeps its last window samples for percentiles. While
+    recording, all samples are also logged with timestamps for later export.
+    Disabled metrics cost a single attribute check per call.
+
+    Times are in milliseconds, solver statistics are counts per frame:
+    frame - time between two animation frames;
+    integration - integration time per frame;
+    nfev, steps, rejected - solver function evaluations, accepted and rejected steps per frame;
+    history, artists, draw - Equation.update, Plot.animate and canvas drawing times;
+    """
+    def __init__(self, window=500):
+        self.enabled = False
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.log = None
+
+    def enable(self, record=False):
+        self.enabled = True
+        if record and self.log is None:
+            self.log = []
+
+    def disable(self):
+        self.enabled = self.log is not None
+
+    def add(self, name, value):
+        if not self.enabled:
+            return
+        self.samples[name].append(value)
+        if self.log is not None:
+            self.log.append((time.time(), name, value))
+
+    def timer(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self.timing(name)
+
+    @contextmanager
+    def timing(self, name):
+        start = time.perf_counter()
+        yield
+        self.add(name, (time.perf_counter() - start) * 1e3)
+
+    def percentile(self, name, q):
+        values = list(self.samples.get(name, ()))
+        return np.percentile(values, q) if values else float('nan')
+
+    def mean(self, name):
+        values = list(self.samples.get(name, ()))
+        return np.mean(values) if values else float('nan')
+
+    def fps(self):
+        return 1e3 / self.mean("frame")
+
+    def summary(self):
+        return {name: {"mean": self.mean(name),
+                       "p50": self.percentile(name, 50),
+                       "p99": self.percentile(name, 99),
+                       "count": len(values)}
+                for name, values in list(self.samples.items())}
+
+    def report(self):
+        """
+        Returns short multi-line text for the performance overlay.
+        """
+        return ("FPS %.1f  frame p50 %.1f ms  p99 %.1f ms\n"
+                "integration %.2f ms  nfev %.1f  rejected %.2f per frame\n"
+                "history %.3f ms  artists %.3f ms  draw %.2f ms"
+                % (self.fps(), self.percentile("frame", 50), self.percentile("frame", 99),
+                   self.mean("integration"), self.mean("nfev"), self.mean("rejected"),
+                   self.mean("history"), self.mean("artists"), self.mean("draw")))
+
+    def export(self, path):
+        """
+        Saves the log (or the current samples if not recording) to .csv or .json file.
+        """
+        if self.log is not None:
+            rows = list(self.log)
+        else:
+            rows = [(None, name, value) for name, values in list(self.samples.items()) for value in values]
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(("time", "metric", "value"))
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as file:
+                json.dump({"summary": self.summary(),
+                           "samples": [{"time": t, "metric": name, "value": value}
+                                       for t, name, value in rows]}, file, indent=1)
+
+
+metrics = Metrics()
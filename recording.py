@@ -0,0 +1,225 @@
+import json
+import struct
+import numpy as np
+import equation
+from history import History
+
+
+MAGIC = b"DCHAOS02"
+ROW = 3 * 8
+# Bits of the NaN marking restart rows. Diverged trajectories are recorded with NaN
+# coordinates as well, but arithmetic never produces this payload.
+MARKER = np.uint64(0x7FF8444348414F53)
+
+
+def write_header(file, header):
+    """
+    Writes magic bytes, length of the JSON header and the header itself,
+    padded so that rows start at a multiple of 8 bytes.
+    """
+    data = json.dumps(header).encode()
+    data += b" " * (-(len(MAGIC) + 4 + len(data)) % 8)
+    file.write(MAGIC + struct.pack("<I", len(data)) + data)
+
+
+def read_header(file):
+    """
+    Returns the header of a recording and the offset of its first row.
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a recording")
+    length, = struct.unpack("<I", file.read(4))
+    return json.loads(file.read(length)), len(MAGIC) + 4 + length
+
+
+def is_marker(rows):
+    """
+    Returns which of the rows (or whether a single row) are restart markers.
+    """
+    return np.all(rows[..., :2].view(np.uint64) == MARKER, axis=-1)
+
+
+class Recorder:
+    """
+    Append-only recording of a live session.
+
+    The file has a small JSON header (system, params, solver settings)
+    followed by fixed-width rows of three float64 values. Rows are
+    calculated points, the first one is the point the recording starts at.
+    Every restart (new initial conditions or parameters) is stored as
+    a block of rows: a marker (MARKER, MARKER, number of params), MARKER
+    being a NaN with its own bits, the values of all params, three per row,
+    and the new initial point. A warm restart (new parameters, the trajectory
+    goes on) has a negative number of params and no initial point.
+    """
+    def __init__(self, path, eq):
+        self.file = open(path, "wb")
+        self.order = list(eq.params)
+        write_header(self.file, {"system": type(eq).__name__,
+                                 "params": {name: float(value) for name, value in eq.params.items()},
+                                 "time_scale": eq.time_scale,
+                                 "method": eq.method,
+                                 "trace_length": eq.trace_length})
+        self.append(eq.history.last)
+
+    def append(self, point):
+        self.file.write(np.asarray(point, dtype=np.float64).tobytes())
+
+    def restart(self, eq, warm=False):
+        values = [float(eq.params[name]) for name in self.order]
+        values += [0.] * (-len(values) % 3)
+        marker = np.array((0., 0., -len(self.order) if warm else len(self.order)))
+        marker[:2].view(np.uint64)[:] = MARKER
+        self.append(marker)
+        self.file.write(np.asarray(values, dtype=np.float64).tobytes())
+        if not warm:
+            self.append(eq.history.last)
+
+    def close(self):
+        self.file.close()
+
+
+class Playback:
+    """
+    Frame sequence replayed from a memory-mapped recording, without integration.
+
+    Opening a recording does not read its rows, so it takes the same time
+    for any file size. Frames are appended to the history of the equation
+    (a new one of the recorded system if none is given), restarts call
+    on_restart(params, initial) when they are reached, initial is None
+    for warm restarts.
+
+    speed - frames per animation tick, below 1 a frame is shown every few ticks;
+    position - index of the next row;
+    """
+    def __init__(self, path, eq=None, on_restart=None):
+        with open(path, "rb") as file:
+            self.header, offset = read_header(file)
+            file.seek(0, 2)
+            count = (file.tell() - offset) // ROW
+        self.rows = np.memmap(path, dtype=np.float64, mode="r", offset=offset, shape=(count, 3))
+        self.order = list(self.header["params"])
+        if eq is None:
+            eq = equation.by_name(self.header["system"])
+            eq.params.update(self.header["params"])
+            eq.trace_length = self.header["trace_length"]
+        self.equation = eq
+        self.on_restart = on_restart
+        self.speed = 1.
+        self.credit = 0.
+        self.position = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Returns the next frame to animate, after adding the skipped ones to the history.
+        Raises StopIteration on ticks without a frame and at the end of the recording.
+        """
+        self.credit += self.speed
+        frames = int(self.credit)
+        if frames == 0 or self.position >= len(self.rows):
+            raise StopIteration
+        self.credit -= frames
+        point = None
+        for _ in range(frames):
+            if self.position >= len(self.rows):
+                break
+            if point is not None:
+                self.equation.update(point)
+            point = self.read()
+        if point is None:
+            raise StopIteration
+        return point
+
+    def read(self):
+        """
+        Returns the row at position and moves past it, handling restarts on the way.
+        """
+        row = self.rows[self.position]
+        while is_marker(row):
+            params, initial, end = self.block(self.position)
+            self.position = end
+            if self.on_restart is not None:
+                self.on_restart(params, initial)
+            if self.position >= len(self.rows):
+                return initial
+            row = self.rows[self.position]
+        self.position += 1
+        return tuple(row.tolist())
+
+    def block(self, marker):
+        """
+        Returns params and initial point (None if warm) of a restart block and the row following it.
+        """
+        count = int(self.rows[marker, 2])
+        size = -(-abs(count) // 3)
+        params = dict(zip(self.order, self.rows[marker + 1:marker + 1 + size].ravel()[:abs(count)].tolist()))
+        if count < 0:
+            return params, None, marker + 1 + size
+        return params, tuple(self.rows[marker + 1 + size].tolist()), marker + 2 + size
+
+    def frames(self, begin, end):
+        """
+        Returns rows from begin to end which are points of the last trajectory started there.
+        """
+        # A block starting shortly before begin may still cover it.
+        first = max(0, begin - len(self.order) // 3 - 2)
+        rows = self.rows[first:end]
+        keep = np.zeros(len(rows), dtype=bool)
+        keep[begin - first:] = True
+        for marker in np.flatnonzero(is_marker(rows)):
+            count = int(rows[marker, 2])
+            size = -(-abs(count) // 3)
+            if count < 0:
+                keep[marker:marker + 1 + size] = False
+            else:
+                keep[:marker + 1 + size] = False
+        return rows[keep]
+
+    def last_marker(self, end, chunk=65536):
+        """
+        Returns index of the last restart marker before row end, None if there is none.
+        Searches backwards in chunks, so the cost depends on the distance only.
+        """
+        while end > 0:
+            start = max(0, end - chunk)
+            rows = self.rows[start:end]
+            markers = np.flatnonzero(is_marker(rows))
+            if len(markers):
+                return start + markers[-1]
+            end = start
+        return None
+
+    def seek(self, position):
+        """
+        Moves to the row position, rebuilding params and history of the equation
+        as they were there. Returns History of the previous trajectory, empty if there was none.
+        """
+        eq = self.equation
+        position = min(max(0, int(position)), len(self.rows))
+        marker = self.last_marker(position)
+        params = self.header["params"] if marker is None else self.block(marker)[0]
+        # The trajectory was started by the last restart which was not warm.
+        cold = marker
+        while cold is not None and self.rows[cold, 2] < 0:
+            cold = self.last_marker(cold)
+        shadow = History(eq.trace_length, pyramid=False)
+        if cold is None:
+            initial, start = tuple(self.rows[0].tolist()), 1
+        else:
+            _, initial, start = self.block(cold)
+            shadow.extend(self.frames(max(0, cold - eq.trace_length), cold))
+        eq.params.update(params)
+        eq.set_initial_conditions(*initial)
+        points = self.frames(max(start, position - eq.trace_length), position)
+        eq.history.extend(points)
+        if eq.density is not None:
+            eq.density.extend(points)
+        self.position = max(position, start if marker is None else self.block(marker)[2])
+        self.credit = 0.
+        return shadow
@@ -0,0 +1,148 @@
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import equation
+from batch import system_by_name, check_param
+from history import COORDINATES
+
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deterministic-chaos", "sweep")
+
+
+def local_maxima(values):
+    """
+    Returns local maxima of a sampled signal, refined by parabolic interpolation.
+    """
+    left, middle, right = values[:-2], values[1:-1], values[2:]
+    peaks = (middle > left) & (middle >= right)
+    left, middle, right = left[peaks], middle[peaks], right[peaks]
+    curvature = left - 2 * middle + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature != 0, 0.5 * (left - right) / curvature, 0.)
+    return middle - 0.25 * (left - right) * shift
+
+
+def sweep_point(system, params, duration, transient, step, method, coordinate):
+    """
+    Integrates one parameter set and returns local maxima of the coordinate
+    reached after the transient. Runs in a worker process.
+    """
+    eq = equation.by_name(system)
+    eq.params.update(params)
+    eq.time_scale = 1 / step
+    eq.method = method
+    eq.rk_step = step
+    frames = eq.data_gen()
+    skipped = int(round(transient / step))
+    try:
+        # An empty chunk would end the integration, so a zero transient is not integrated.
+        if skipped > 0:
+            frames.chunk_size = skipped
+            frames.next_chunk()
+        frames.chunk_size = int(round((duration - transient) / step))
+        points = frames.next_chunk()
+    except StopIteration:
+        return np.empty(0)
+    return local_maxima(points[:, COORDINATES[coordinate]])
+
+
+class Sweep:
+    """
+    Parameter sweep producing a bifurcation diagram.
+
+    Every value of the swept parameter is integrated separately in a process pool,
+    the transient is dropped and local maxima of one coordinate are collected.
+    Results of single values are cached on disk, keyed by all settings
+    of the integration, so repeated sweeps only calculate new values.
+    """
+    def __init__(self, system, param, duration=500., transient=200., step=0.01,
+                 method="RK4", coordinate="x", cache_dir=CACHE_DIR):
+        self.system = system
+        self.param = param
+        self.duration = duration
+        self.transient = transient
+        self.step = step
+        self.method = method
+        self.coordinate = coordinate
+        self.cache_dir = cache_dir
+        self.params = equation.by_name(system).params
+        if param not in self.params:
+            raise KeyError(param)
+
+    def point_args(self, value):
+        params = dict(self.params, **{self.param: float(value)})
+        return (self.system, params, self.duration, self.transient, self.step,
+                self.method, self.coordinate)
+
+    def cache_path(self, value):
+        if self.cache_dir is None:
+            return None
+        key = hashlib.sha1(repr(self.point_args(value)).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def run(self, values, workers=None):
+        """
+        Returns (M, 2) array of (parameter value, local maximum) pairs.
+        """
+        results = dict()
+        missing = []
+        for value in values:
+            path = self.cache_path(value)
+            if path is not None and os.path.exists(path):
+                results[value] = np.load(path)
+            else:
+                missing.append(value)
+
+        if missing:
+            if self.cache_dir is not None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+            args = zip(*(self.point_args(value) for value in missing))
+            chunksize = max(1, len(missing) // (4 * (workers or os.cpu_count() or 1)))
+            with ProcessPoolExecutor(workers) as pool:
+                for value, maxima in zip(missing, pool.map(sweep_point, *args, chunksize=chunksize)):
+                    results[value] = maxima
+                    if self.cache_dir is not None:
+                        np.save(self.cache_path(value), maxima)
+
+        diagram = [np.column_stack((np.full(len(results[value]), value), results[value]))
+                   for value in values]
+        return np.concatenate(diagram) if diagram else np.empty((0, 2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculate and plot a bifurcation diagram.")
+    parser.add_argument("system", help="system name, e.g. rossler")
+    parser.add_argument("param", help="swept parameter, e.g. c")
+    parser.add_argument("start", type=float)
+    parser.add_argument("stop", type=float)
+    parser.add_argument("--values", type=int, default=500, help="number of parameter values")
+    parser.add_argument("--duration", type=float, default=500.)
+    parser.add_argument("--transient", type=float, default=200.)
+    parser.add_argument("--step", type=float, default=0.01)
+    parser.add_argument("--method", default="RK4")
+    parser.add_argument("--coordinate", choices=COORDINATES, default="x")
+    parser.add_argument("--workers", type=int, default=None, help="processes, all cores by default")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--output", default="bifurcation.png", help=".png/.pdf image or .npy array")
+    args = parser.parse_args(argv)
+    check_param(parser, system_by_name(parser, args.system), args.param)
+
+    sweep = Sweep(args.system, args.param, args.duration, args.transient, args.step,
+                  args.method, args.coordinate, None if args.no_cache else CACHE_DIR)
+    start = time.perf_counter()
+    diagram = sweep.run(np.linspace(args.start, args.stop, args.values), args.workers)
+    print("%d values in %.2f s" % (args.values, time.perf_counter() - start))
+
+    if args.output.endswith(".npy"):
+        np.save(args.output, diagram)
+    else:
+        from plot import BifurcationPlot
+        BifurcationPlot(diagram, str(equation.by_name(args.system)), args.param,
+                        args.coordinate).fig.savefig(args.output, dpi=150)
+
+
+if __name__ == "__main__":
+    main()
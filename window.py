@@ -1,20 +1,55 @@
+import copy
 import tkinter as tk
-from tkinter import ttk
+from itertools import chain
+from tkinter import ttk, filedialog
 from ttkthemes import ThemedTk
-import matplotlib.animation as animation
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import equation
+from animator import Animator
+from worker import Worker
+from lyapunov import LyapunovEstimator
+from integrator import FrameIntegrator
+from cache import TrajectoryCache
+from profiler import metrics
+from recording import Recorder, Playback
+from history import COORDINATES
 
 
 class Window:
     """
     Basic window containing GUI elements and animated plot.
+
+    Matplotlib is imported and the plot is built only when the first system
+    is chosen (unless a plot is given), so the window opens quickly.
+    Until then the remaining controls are not bound.
+
+    A session may be recorded to a file and played back later, see recording.py.
+    During playback the animation is fed by the recording instead of the worker.
+    Editing parameters continues live from the current frame of the recording,
+    new initial conditions or another system start a new trajectory.
+
+    The " basins " button maps how soon trajectories starting on the plane of
+    the current axes separate from the one of the sliders, see basins.py,
+    in a separate window. Clicking the map moves the sliders there.
+
+    Edits of parameters and initial conditions are collected for debounce ms
+    and applied together. The worker calculates the first lookahead frames of
+    the new configuration while the old one is still drawn and switches to it
+    without clearing the queue, see Worker.warm_restart. New parameters alone
+    continue the trajectory from its current point and time. Until the switch
+    the frames are integrated with a copy of the equation holding the edited
+    parameters (edited), the drawn equation gets them only when switching.
     """
-    def __init__(self, plot):
-        self.plot = plot
+    debounce = 150
+    lookahead = 10
+    basin_resolution = 256
+
+    def __init__(self, plot=None):
+        self.plot = None
         self.root = ThemedTk(theme='breeze')
         self.label = ttk.Label(self.root, text="Deterministic chaos")
-        self.canvas = FigureCanvasTkAgg(plot.fig, master=self.root)
+        self.canvas = None
+        self.placeholder = ttk.Label(self.root, text="Choose a system from the list", anchor='center',
+                                     width=60)
 
         self.combobox = ttk.Combobox(self.root, width=34)
         self.equation_label = ttk.Label(self.root, text="")
@@ -36,6 +71,29 @@ class Window:
         self.reset = ttk.Button(self.root, text=" reset ", width=7)
         self.pause = ttk.Button(self.root, text=" pause ", width=7)
         self.paused = False
+        self.cloud = ttk.Button(self.root, text=" cloud ", width=7)
+        self.ensemble = False
+        self.stats = ttk.Button(self.root, text=" stats ", width=7)
+        self.density = ttk.Button(self.root, text=" density ", width=7)
+        self.section = ttk.Button(self.root, text=" section ", width=7)
+        self.lyapunov_label = ttk.Label(self.root, text="")
+        self.lyapunov = None
+        self.record = ttk.Button(self.root, text=" record ", width=7)
+        self.play = ttk.Button(self.root, text=" play ", width=7)
+        self.speed = ttk.Combobox(self.root, width=6, values=("0.1", "0.25", "0.5", "1", "2", "5", "20", "100"))
+        self.speed.set("1")
+        self.position = tk.Scale(self.root, length=800, sliderlength=20, from_=0, to=0, showvalue=False,
+                                 orient="horizontal", command=self.scrub)
+        self.playback = None
+        self.scrubbing = False
+        self.pending = dict()
+        self.pending_job = None
+        self.edited = None
+        self.view = ttk.Button(self.root, text=" 3D ", width=7)
+        self.tail = ttk.Button(self.root, text=" tail ", width=7)
+        # The fading tail is only drawn in 3-D, the density view only in 2-D, see toggle_view.
+        self.tail.state(["disabled"])
+        self.basins = ttk.Button(self.root, text=" basins ", width=7)
 
         self.set_window_geometry()
         self.add_options_to_list()
@@ -43,13 +101,30 @@ class Window:
         self.bind_gui_elements()
         self.beautify()
 
-        self.ani = animation.FuncAnimation(self.plot.fig, self.plot.animate,
-                                           frames=self.plot.equation.data_gen,
-                                           interval=20, blit=False, cache_frame_data=False)
+        self.cache = TrajectoryCache()
+        self.worker = Worker()
+        self.ani = None
+        if plot is not None:
+            self.create_plot(plot)
+        self.show_lyapunov()
+        self.show_position()
+
+    def create_plot(self, plot):
+        """
+        Shows the plot in place of the placeholder and starts the animation.
+        """
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.plot = plot
+        self.canvas = FigureCanvasTkAgg(plot.fig, master=self.root)
+        self.placeholder.grid_forget()
+        self.canvas.get_tk_widget().grid(column=0, row=1, rowspan=10)
+        self.bind_controls()
+        self.restart_animation()
+        self.ani = Animator(self.plot, self.worker, interval=20, blit=True)
 
     def set_window_geometry(self):
         width = 1250
-        height = 650
+        height = 740
         self.root.geometry("%dx%d" % (width, height))
         self.root.title("Deterministic chaos")
 
@@ -66,13 +141,18 @@ class Window:
         self.equation_label['font'] = unified_font
         self.param_label['background'] = 'white'
         self.param_label['font'] = unified_font
+        self.lyapunov_label['background'] = 'white'
+        self.lyapunov_label['font'] = unified_font
+        self.placeholder['background'] = 'white'
+        self.placeholder['font'] = unified_font
         self.x_slider['background'] = 'white'
         self.y_slider['background'] = 'white'
         self.z_slider['background'] = 'white'
+        self.position['background'] = 'white'
 
     def place_components(self):
         self.label.grid(column=0, row=0)
-        self.canvas.get_tk_widget().grid(column=0, row=1, rowspan=10)
+        self.placeholder.grid(column=0, row=1, rowspan=10)
         self.combobox.grid(column=1, columnspan=4, row=1)
         self.equation_label.grid(column=1, columnspan=4, row=2)
         self.initial_cond_label.grid(column=1, columnspan=4, row=3, sticky='S')
@@ -87,31 +167,53 @@ class Window:
         self.right.grid(column=3, row=9)
         self.reset.grid(column=4, row=9)
         self.pause.grid(column=1, row=9)
+        self.cloud.grid(column=1, row=10)
+        self.stats.grid(column=2, row=10)
+        self.density.grid(column=3, row=10)
+        self.section.grid(column=4, row=10)
+        self.lyapunov_label.grid(column=0, columnspan=5, row=11)
+        self.position.grid(column=0, row=12)
+        self.record.grid(column=1, row=12)
+        self.play.grid(column=2, row=12)
+        self.speed.grid(column=3, columnspan=2, row=12)
+        self.view.grid(column=1, row=13)
+        self.tail.grid(column=2, row=13)
+        self.basins.grid(column=3, row=13)
 
     def add_options_to_list(self):
-        self.combobox['values'] = ("Lorenz system",
-                                   "Rössler system",
-                                   "Chua's circuit",
-                                   "Chen system",
-                                   "Thomas system",
-                                   "Aizawa system")
+        self.combobox['values'] = [cls.title for cls in equation.SYSTEMS]
 
     def bind_gui_elements(self):
         self.combobox.bind('<<ComboboxSelected>>', self.update_equation)
+        self.play.bind('<Button>', self.open_recording)
+        self.speed.bind('<<ComboboxSelected>>', self.change_speed)
+        self.position.bind('<ButtonPress-1>', self.start_scrubbing)
+        self.position.bind('<ButtonRelease-1>', self.stop_scrubbing)
+
+    def bind_controls(self):
         self.param_combo.bind('<<ComboboxSelected>>', self.update_entry_param)
-        self.x_slider.bind("<ButtonRelease-1>", self.apply_changes)
-        self.y_slider.bind("<ButtonRelease-1>", self.apply_changes)
-        self.z_slider.bind("<ButtonRelease-1>", self.apply_changes)
+        self.x_slider.bind("<ButtonRelease-1>", self.change_initial_conditions)
+        self.y_slider.bind("<ButtonRelease-1>", self.change_initial_conditions)
+        self.z_slider.bind("<ButtonRelease-1>", self.change_initial_conditions)
         self.apply.bind('<Button>', self.apply_param_value)
         self.reset.bind('<Button>', self.update_equation)
         self.pause.bind('<Button>', self.pause_simulation)
         self.right.bind('<Button>', self.next_axes)
         self.left.bind('<Button>', self.prev_axes)
+        self.cloud.bind('<Button>', self.toggle_ensemble)
+        self.stats.bind('<Button>', self.toggle_stats)
+        self.density.bind('<Button>', self.toggle_density)
+        self.section.bind('<Button>', self.toggle_section)
+        self.record.bind('<Button>', self.toggle_recording)
+        self.view.bind('<Button>', self.toggle_view)
+        self.tail.bind('<Button>', self.toggle_tail)
+        self.basins.bind('<Button>', self.show_basins)
 
     def set_sliders(self):
-        self.x_slider.set(self.plot.equation.x[0])
-        self.y_slider.set(self.plot.equation.y[0])
-        self.z_slider.set(self.plot.equation.z[0])
+        x, y, z = self.plot.equation.initial
+        self.x_slider.set(x)
+        self.y_slider.set(y)
+        self.z_slider.set(z)
 
     def load_param_dict(self):
         params = list(self.plot.equation.params.keys())
@@ -129,46 +231,143 @@ class Window:
                 new_param = float(self.param_value.get())
             except ValueError:
                 return
-            self.plot.equation.params[self.param_combo.get()] = new_param
+            self.pending.setdefault("params", dict())[self.param_combo.get()] = new_param
+            self.schedule_changes()
+
+    def change_initial_conditions(self, _):
+        self.pending["initial"] = (self.x_slider.get(), self.y_slider.get(), self.z_slider.get())
+        self.schedule_changes()
+
+    def schedule_changes(self):
+        if self.pending_job is not None:
+            self.root.after_cancel(self.pending_job)
+        self.pending_job = self.root.after(self.debounce, self.commit_changes)
+
+    def cancel_changes(self):
+        if self.pending_job is not None:
+            self.root.after_cancel(self.pending_job)
+        self.pending_job = None
+        self.pending = dict()
+
+    def commit_changes(self):
+        """
+        Applies all edits made since the last commit at once.
+        """
+        params = self.pending.get("params", dict())
+        initial = self.pending.get("initial")
+        self.pending_job = None
+        self.pending = dict()
+        eq = self.plot.equation
+        if self.playback is not None and initial is None and not self.ensemble:
+            eq.params.update(params)
+            self.continue_live()
+            return
+        if self.ensemble or self.playback is not None:
+            # Ensembles and recordings have no single trajectory to continue.
+            eq.params.update(params)
             self.apply_changes()
+            return
+
+        # Edits not switched to yet are kept, configurations are switched in order.
+        base = eq if self.edited is None else self.edited
+        edited = copy.copy(base)
+        edited.params = dict(base.params, **params)
+        self.edited = edited
+
+        def configuration(state, frame):
+            return self.configuration(eq, edited, initial, state, frame)
+
+        self.worker.warm_restart(configuration, lookahead=self.lookahead)
+
+    def configuration(self, eq, edited, initial, state, frame):
+        """
+        Returns frame sequence of eq with the parameters of its copy edited, continued
+        from the point state (the last drawn one if None) at the index frame unless
+        initial conditions are given. Called by the worker thread.
+        Its first item switches the window to the new trajectory when it is reached.
+        """
+        if initial is None:
+            state = eq.history.last if state is None else state
+            lyapunov = LyapunovEstimator(edited, state=state)
+            frames = FrameIntegrator(edited, start=frame, state=state)
+        else:
+            lyapunov = LyapunovEstimator(edited, state=initial)
+            if edited.crossings is not None:
+                frames = FrameIntegrator(edited, state=initial)
+            else:
+                frames = self.cache.frames(edited, state=initial)
+
+        def switch():
+            eq.params.update(edited.params)
+            if initial is not None:
+                self.plot.last = eq.history
+                self.plot_shadow()
+                eq.set_initial_conditions(*initial)
+            if eq.recorder is not None:
+                eq.recorder.restart(eq, warm=initial is None)
+            self.lyapunov = lyapunov
+
+        return chain((switch,), lyapunov.track(frames))
 
     def apply_changes(self, event=None):
-        self.plot.last_x = self.plot.equation.x
-        self.plot.last_y = self.plot.equation.y
-        self.plot.last_z = self.plot.equation.z
+        self.plot.last = self.plot.equation.history
         self.plot_shadow()
         self.plot.equation.set_initial_conditions(self.x_slider.get(),
                                                   self.y_slider.get(),
                                                   self.z_slider.get())
-        self.ani.frame_seq = self.plot.equation.data_gen()
+        if self.plot.equation.recorder is not None:
+            self.plot.equation.recorder.restart(self.plot.equation)
+        self.restart_animation()
 
-    def plot_shadow(self):
-        line = self.plot.shadow.pop(0)
-        line.remove()
-        axes_to_draw = self.plot.equation.axes
-        if axes_to_draw == 0:
-            self.plot.shadow = self.plot.ax.plot(self.plot.last_x, self.plot.last_y, 'k-', alpha=0.15)
-        elif axes_to_draw == 1:
-            self.plot.shadow = self.plot.ax.plot(self.plot.last_y, self.plot.last_z, 'k-', alpha=0.15)
+    def continue_live(self):
+        """
+        Ends playback, the trajectory goes on live from the current frame of the recording.
+        """
+        self.cancel_changes()
+        self.edited = None
+        self.stop_playback()
+        eq = self.plot.equation
+        self.lyapunov = LyapunovEstimator(eq)
+        self.worker.restart(self.lyapunov.track(FrameIntegrator(eq, start=eq.history.count - 1)))
+
+    def restart_animation(self):
+        self.cancel_changes()
+        self.edited = None
+        self.stop_playback()
+        eq = self.plot.equation
+        if self.ensemble:
+            self.lyapunov = None
+            self.worker.restart(eq.ensemble_gen(eq.initial_cloud()))
         else:
-            self.plot.shadow = self.plot.ax.plot(self.plot.last_x, self.plot.last_z, 'k-', alpha=0.15)
+            # Crossings are found during integration, so they need the frames calculated anew.
+            frames = eq.data_gen() if eq.crossings is not None else self.cache.frames(eq)
+            self.lyapunov = LyapunovEstimator(eq)
+            self.worker.restart(self.lyapunov.track(frames))
+
+    def show_lyapunov(self):
+        if self.lyapunov is not None and self.lyapunov.time > 0:
+            exponents = ", ".join("%.3f" % value for value in self.lyapunov.exponents)
+            self.lyapunov_label.config(text="Lyapunov exponents: " + exponents)
+        else:
+            self.lyapunov_label.config(text="")
+        self.root.after(500, self.show_lyapunov)
+
+    def plot_shadow(self):
+        self.plot.draw_shadow()
 
     def update_equation(self, event=None):
-        if self.combobox.get() == "Lorenz system":
-            self.plot.new_equation(equation.LorenzSystem())
-        elif self.combobox.get() == "Rössler system":
-            self.plot.new_equation(equation.RosslerSystem())
-        elif self.combobox.get() == "Chua's circuit":
-            self.plot.new_equation(equation.ChuaCircuit())
-        elif self.combobox.get() == "Chen system":
-            self.plot.new_equation(equation.ChenSystem())
-        elif self.combobox.get() == "Thomas system":
-            self.plot.new_equation(equation.ThomasSystem())
-        elif self.combobox.get() == "Aizawa system":
-            self.plot.new_equation(equation.AizawaSystem())
+        if self.plot is not None:
+            self.stop_recording()
+        systems = {cls.title: cls for cls in equation.SYSTEMS}
+        eq = systems.get(self.combobox.get(), equation.Equation)()
+        if self.plot is None:
+            from plot import Plot
+            self.create_plot(Plot(eq))
         else:
-            self.plot.new_equation(equation.Equation())
-        self.ani.frame_seq = self.plot.equation.data_gen()
+            self.plot.new_equation(eq)
+        if self.ensemble:
+            self.plot.show_ensemble()
+        self.restart_animation()
         self.set_sliders()
         self.load_param_dict()
         self.equation_label.config(text=self.plot.equation.text_equation())
@@ -185,10 +384,266 @@ class Window:
         self.plot.change_axes(prev_a)
         self.plot_shadow()
 
+    def toggle_ensemble(self, _):
+        self.ensemble = not self.ensemble
+        if self.ensemble:
+            self.plot.show_ensemble()
+        else:
+            self.plot.hide_ensemble()
+        self.restart_animation()
+
+    def toggle_density(self, _):
+        if self.density.instate(["disabled"]):
+            return
+        if self.plot.image is None:
+            self.plot.show_density()
+        else:
+            self.plot.hide_density()
+        self.plot.invalidate_background()
+
+    def toggle_section(self, _):
+        if self.plot.crossings is None:
+            self.plot.show_section()
+            # Show the plane of the section: x -> y&z, y -> x&z, z -> x&y.
+            self.plot.equation.axes = (1, 2, 0)[self.plot.equation.section[0]]
+            self.plot.change_axes(self.plot.equation.axes)
+            self.plot_shadow()
+        else:
+            self.plot.hide_section()
+            self.plot.invalidate_background()
+        self.restart_animation()
+
+    def toggle_view(self, _):
+        """
+        Switches between the 2-D projection and the 3-D view, keeping the equation and its history.
+        """
+        from plot import Plot, Plot3D
+        old = self.plot
+        old.hide_density()
+        old.fig.clear()
+        self.plot = Plot(old.equation, old.fig) if isinstance(old, Plot3D) else Plot3D(old.equation, old.fig)
+        self.plot.last = old.last
+        if self.ensemble:
+            self.plot.show_ensemble()
+        if old.crossings is not None:
+            self.plot.show_section()
+        if old.hud is not None:
+            self.plot.show_hud()
+        if not isinstance(self.plot, Plot3D):
+            self.plot.change_axes(self.plot.equation.axes)
+        self.ani.swap(self.plot)
+        three_d = isinstance(self.plot, Plot3D)
+        self.view.config(text=" 2D " if three_d else " 3D ")
+        self.density.state(["disabled" if three_d else "!disabled"])
+        self.tail.state(["!disabled" if three_d else "disabled"])
+        self.plot_shadow()
+        self.plot.fig.canvas.draw_idle()
+
+    def toggle_tail(self, _):
+        if self.tail.instate(["disabled"]):
+            return
+        if self.plot.tail is None:
+            self.plot.show_tail()
+        else:
+            self.plot.hide_tail()
+
+    def show_basins(self, _):
+        """
+        Calculates the map of separation times in a background thread, with worker
+        processes started by spawn, as forking a process running Tk is not safe.
+        """
+        import multiprocessing
+        import threading
+        from basins import BasinExplorer
+        if self.basins.instate(["disabled"]):
+            return
+        eq = self.plot.equation
+        plane = ("xy", "yz", "xz")[eq.axes]
+        reference = (self.x_slider.get(), self.y_slider.get(), self.z_slider.get())
+        fixed = reference[3 - COORDINATES[plane[0]] - COORDINATES[plane[1]]]
+        explorer = BasinExplorer(type(eq).__name__, eq.params, plane, fixed, reference=reference)
+        result = dict()
+
+        def run():
+            result["map"] = explorer.run(resolution=self.basin_resolution,
+                                         context=multiprocessing.get_context("spawn"))
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.basins.state(["disabled"])
+        self.root.after(200, self.open_basins, thread, result, explorer)
+
+    def open_basins(self, thread, result, explorer):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from basins import map_plot
+        if thread.is_alive():
+            self.root.after(200, self.open_basins, thread, result, explorer)
+            return
+        self.basins.state(["!disabled"])
+        if "map" not in result:
+            return
+        layers, extent = result["map"]
+        plane = explorer.plane
+        plot = map_plot(layers, extent, "separation", explorer.system, plane, explorer.fixed)
+        first, second = COORDINATES[plane[0]], COORDINATES[plane[1]]
+        plot.ax.plot(explorer.reference[first], explorer.reference[second], 'r+', ms=10)
+        sliders = (self.x_slider, self.y_slider, self.z_slider)
+
+        def choose(event):
+            if event.inaxes is plot.ax:
+                sliders[first].set(event.xdata)
+                sliders[second].set(event.ydata)
+                self.change_initial_conditions(event)
+
+        top = tk.Toplevel(self.root)
+        top.title(plot.ax.get_title())
+        canvas = FigureCanvasTkAgg(plot.fig, master=top)
+        canvas.mpl_connect('button_press_event', choose)
+        canvas.get_tk_widget().pack()
+        canvas.draw()
+
+    def toggle_stats(self, _):
+        if self.plot.hud is None:
+            metrics.enable()
+            self.plot.show_hud()
+        else:
+            metrics.disable()
+            self.plot.hide_hud()
+        self.plot.invalidate_background()
+
+    def toggle_recording(self, _):
+        if self.plot.equation.recorder is not None:
+            self.stop_recording()
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".rec", filetypes=[("Recordings", "*.rec")])
+        if path:
+            self.plot.equation.recorder = Recorder(path, self.plot.equation)
+            self.record.config(text=" stop ")
+
+    def stop_recording(self):
+        if self.plot.equation.recorder is not None:
+            self.plot.equation.recorder.close()
+            self.plot.equation.recorder = None
+            self.record.config(text=" record ")
+
+    def open_recording(self, _):
+        path = filedialog.askopenfilename(filetypes=[("Recordings", "*.rec"), ("All files", "*")])
+        if not path:
+            return
+        try:
+            playback = Playback(path, on_restart=self.replay_restart)
+        except (OSError, ValueError, KeyError):
+            return
+        eq = playback.equation
+        if self.plot is None:
+            from plot import Plot
+            self.create_plot(Plot(eq))
+        else:
+            self.stop_recording()
+            self.plot.new_equation(eq)
+        self.worker.restart(None)
+        self.lyapunov = None
+        self.playback = playback
+        self.playback.speed = float(self.speed.get())
+        self.ani.replace(playback)
+        self.combobox.set(eq.title)
+        self.equation_label.config(text=eq.text_equation())
+        self.load_param_dict()
+        self.position.config(to=len(playback))
+        self.seek(0)
+
+    def stop_playback(self):
+        if self.playback is not None:
+            self.playback = None
+            self.ani.replace(self.worker)
+            self.position.config(to=0)
+
+    def replay_restart(self, params, initial):
+        eq = self.plot.equation
+        eq.params.update(params)
+        if initial is not None:
+            self.plot.last = eq.history
+            self.plot_shadow()
+            eq.set_initial_conditions(*initial)
+            self.set_sliders()
+
+    def seek(self, position):
+        self.plot.last = self.playback.seek(position)
+        self.plot_shadow()
+        self.set_sliders()
+        if self.playback.position < len(self.playback):
+            artists = self.plot.animate(self.playback.read())
+            if self.paused:
+                self.plot.fig.canvas.draw_idle()
+            else:
+                self.plot.blit(artists)
+
+    def scrub(self, value):
+        if self.playback is not None and self.scrubbing:
+            self.seek(int(float(value)))
+
+    def start_scrubbing(self, _):
+        self.scrubbing = True
+
+    def stop_scrubbing(self, _):
+        self.scrubbing = False
+
+    def change_speed(self, _):
+        if self.playback is not None:
+            try:
+                self.playback.speed = max(0., float(self.speed.get()))
+            except ValueError:
+                pass
+
+    def show_position(self):
+        if self.playback is not None and not self.scrubbing:
+            self.position.set(self.playback.position)
+        self.root.after(200, self.show_position)
+
     def pause_simulation(self, _):
         if not self.paused:
+            self.worker.pause()
             self.ani.pause()
             self.paused = True
         else:
+            self.worker.resume()
             self.ani.resume()
             self.paused = False
+
+
+class ComparisonWindow:
+    """
+    Window animating several equations side by side, see plot.MultiPlot.
+    All panels are calculated by one Worker, one channel each,
+    and redrawn by one Animator.
+    """
+    def __init__(self, plot):
+        self.plot = plot
+        self.root = ThemedTk(theme='breeze')
+        self.root.title("Deterministic chaos - comparison")
+        self.root['background'] = 'white'
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.canvas = FigureCanvasTkAgg(plot.fig, master=self.root)
+        self.pause = ttk.Button(self.root, text=" pause ", width=7)
+        self.paused = False
+        self.canvas.get_tk_widget().grid(column=0, row=0)
+        self.pause.grid(column=0, row=1)
+        self.pause.bind('<Button>', self.pause_simulation)
+
+        self.cache = TrajectoryCache()
+        self.worker = Worker()
+        for key, panel in enumerate(plot.panels):
+            self.worker.restart(self.cache.frames(panel.equation), key)
+        first = plot.panels[0]
+        self.ani = Animator(first, self.worker.channel(0), interval=20, blit=True)
+        for key, panel in enumerate(plot.panels[1:], 1):
+            self.ani.add(panel, self.worker.channel(key))
+
+    def pause_simulation(self, _):
+        if not self.paused:
+            self.worker.pause()
+            self.ani.pause()
+        else:
+            self.worker.resume()
+            self.ani.resume()
+        self.paused = not self.paused
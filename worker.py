@@ -0,0 +1,244 @@
+import queue
+import threading
+from itertools import islice
+
+
+class Channel:
+    """
+    Bounded queue of frames calculated by a Worker from one frame sequence.
+
+    The queue size limits how far the worker may run ahead of playback.
+    Callables yielded by a sequence are not frames, they are called by the
+    consumer (in its thread) when reached, e.g. to start a new trajectory
+    exactly where its frames begin.
+
+    generation - id of the current frame sequence, frames of previous
+                 sequences still waiting in the queue are dropped;
+    frame_seq, producing - sequence being calculated and its generation,
+                           used by the worker thread only;
+    produced - index of the next queued item, used by the worker thread only;
+    frame - number of frames (not callables) queued since the last restart,
+            used by the worker thread only;
+    consumed - index of the last item taken by the consumer, -1 before the first;
+    """
+    def __init__(self, maxsize=200):
+        self.frames = queue.Queue(maxsize)
+        self.generation = 0
+        self.frame_seq = None
+        self.producing = 0
+        self.produced = 0
+        self.frame = 0
+        self.consumed = -1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Returns the next calculated frame without waiting.
+        Raises StopIteration when no frame is ready yet.
+        """
+        while True:
+            # Taken under the lock of the queue, so that splice sees what is consumed.
+            with self.frames.mutex:
+                if not self.frames.queue:
+                    raise StopIteration
+                generation, index, data = self.frames.queue.popleft()
+                self.frames.not_full.notify()
+                if generation == self.generation:
+                    self.consumed = index
+            if generation != self.generation:
+                continue
+            if callable(data):
+                data()
+                continue
+            return data
+
+    def put(self, data):
+        self.frames.put((self.producing, self.produced, data))
+        self.produced += 1
+        self.frame += not callable(data)
+
+    def peek(self, ahead):
+        """
+        Returns (index, data, frame) of the frame queued ahead-th from now, or of
+        the last queued one if there are fewer, None if there are none, frame is
+        the number of frames queued since the last restart up to this one.
+        Callables are never returned: frames before a queued callable are skipped,
+        so that it is kept, and None is returned if no frame follows it.
+        """
+        with self.frames.mutex:
+            items = [item for item in self.frames.queue if item[0] == self.producing]
+        position = min(ahead, len(items)) - 1
+        for i, (_, _, data) in enumerate(items):
+            if callable(data):
+                position = max(position, i + 1)
+        if not 0 <= position < len(items):
+            return None
+        _, index, data = items[position]
+        later = sum(not callable(item[2]) for item in items[position + 1:])
+        return index, data, self.frame - later
+
+    def splice(self, index, frame, items):
+        """
+        Keeps queued frames up to the index-th one, the frame-th since the last restart,
+        and queues items after them instead of the rest. Returns False without changing
+        anything if the consumer has already taken items past the index-th one.
+        """
+        with self.frames.mutex:
+            if self.consumed > index:
+                return False
+            queued = self.frames.queue
+            while queued and queued[-1][1] > index:
+                queued.pop()
+            for offset, data in enumerate(items, index + 1):
+                queued.append((self.producing, offset, data))
+            self.produced = index + 1 + len(items)
+            self.frame = frame + sum(not callable(data) for data in items)
+            self.frames.not_empty.notify()
+            return True
+
+    def clear(self):
+        """
+        Drops all queued items, returns the number of dropped frames of the producing sequence.
+        """
+        dropped = 0
+        while True:
+            try:
+                generation, _, data = self.frames.get_nowait()
+            except queue.Empty:
+                return dropped
+            dropped += generation == self.producing and not callable(data)
+
+
+class Worker(threading.Thread):
+    """
+    Background thread pulling frames from frame sequences into bounded queues.
+
+    The GUI sends commands (restart, pause, resume, stop) instead of touching
+    the frame sequences directly, and only drains already calculated frames,
+    so a slow integration step never blocks the Tk main loop.
+
+    A sequence may also be replaced by a warm restart: the new one continues
+    from a frame shortly ahead of playback, and it replaces the following
+    frames only after its first frames are calculated, so playback never
+    waits for it.
+
+    Every sequence has its own Channel, so several plots can share one thread.
+    Channels are served in turns, one frame each, skipping the full ones,
+    and the thread sleeps while all of them are full.
+    Iterating over the worker itself reads channel 0.
+
+    channels - dictionary of key -> Channel;
+    """
+    def __init__(self, frame_seq=None, maxsize=200):
+        super().__init__(daemon=True)
+        self.maxsize = maxsize
+        self.channels = dict()
+        self.commands = queue.Queue()
+        self.paused = False
+        self.stopped = False
+        self.start()
+        if frame_seq is not None:
+            self.restart(frame_seq)
+
+    def channel(self, key=0):
+        if key not in self.channels:
+            self.channels[key] = Channel(self.maxsize)
+        return self.channels[key]
+
+    def restart(self, frame_seq, key=0):
+        channel = self.channel(key)
+        channel.generation += 1
+        self.commands.put(("restart", key, frame_seq, channel.generation))
+
+    def warm_restart(self, make, key=0, lookahead=10):
+        """
+        Replaces the frame sequence by make(state, frame), continuing from the frame
+        queued lookahead frames ahead of playback: state is its point and frame the
+        number of frames since the last restart up to it. Without such a frame
+        (nothing queued, or only callables of a sequence which has ended), or if
+        playback passes it before the first frames of the new sequence are ready,
+        the queue is dropped and make gets state None, continuing from the last drawn frame.
+        """
+        self.commands.put(("warm", key, make, lookahead))
+
+    def pause(self):
+        self.commands.put(("pause",))
+
+    def resume(self):
+        self.commands.put(("resume",))
+
+    def stop(self):
+        for channel in list(self.channels.values()):
+            channel.generation += 1
+        self.commands.put(("stop",))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.channel(0))
+
+    def run(self):
+        while not self.stopped:
+            active = [channel for channel in list(self.channels.values())
+                      if channel.frame_seq is not None and channel.producing == channel.generation]
+            self.handle_commands(block=self.paused or not active)
+            if self.paused:
+                continue
+            produced = False
+            for channel in active:
+                if channel.frame_seq is None or channel.frames.full():
+                    continue
+                try:
+                    data = next(channel.frame_seq)
+                except StopIteration:
+                    channel.frame_seq = None
+                    continue
+                channel.put(data)
+                produced = True
+            if active and not produced:
+                self.handle_commands(timeout=0.01)
+
+    def handle_commands(self, block=False, timeout=None):
+        """
+        Applies pending commands, waits for one when block is set or timeout is given.
+        """
+        block = block or timeout is not None
+        while True:
+            try:
+                command, *args = self.commands.get(block=block, timeout=timeout)
+            except queue.Empty:
+                return
+            block, timeout = False, None
+            if command == "restart":
+                key, frame_seq, generation = args
+                channel = self.channel(key)
+                channel.frame_seq, channel.producing = frame_seq, generation
+                channel.frame = 0
+                channel.clear()
+            elif command == "warm":
+                self.warm(*args)
+            elif command == "pause":
+                self.paused = True
+            elif command == "resume":
+                self.paused = False
+            elif command == "stop":
+                self.stopped = True
+
+    def warm(self, key, make, lookahead):
+        channel = self.channel(key)
+        ahead = channel.peek(lookahead)
+        if ahead is not None:
+            index, state, frame = ahead
+            frame_seq = make(state, frame)
+            if channel.splice(index, frame, list(islice(frame_seq, lookahead))):
+                channel.frame_seq = frame_seq
+                return
+        # Playback stops at the last drawn frame, so nothing is drawn twice.
+        dropped = channel.clear()
+        index, frame = channel.produced - 1, channel.frame - dropped
+        frame_seq = make(None, frame)
+        channel.splice(index, frame, list(islice(frame_seq, lookahead)))
+        channel.frame_seq = frame_seq